@@ -41,7 +41,7 @@ run_p4=1
 if [ ! -d lists ] ; then
 	 mkdir lists
 fi
-find twitter/serialized/ -type f -name "*.pckl" | sort > $listfn
+find twitter/serialized/ -type f \( -name "*.pckl" -o -name "*.tcol" \) | sort > $listfn
 if [ ! -d graph ] ; then
 	 mkdir graph
 fi
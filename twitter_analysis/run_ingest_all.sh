@@ -19,6 +19,7 @@ queue=single-thread  # option
 
 lang="--lang en"  # target language for tweet, comment out to get all tweets
 # geo_bb="--geo_bounding_box=40.4774,-74.2589,40.9176,-73.7004"  # uses (lat-SW,long-SW,lat-NE,long-NE), comment out to get all tweets
+workers="--workers 1"  # number of files ingested in parallel by each job
 
 # Create list of Tweet .tsv.gz files
 if [ ! -d lists ] ; then
@@ -36,7 +37,7 @@ if [ ! -d tmp ] ; then
 	 mkdir tmp
 fi
 echo Running cmd : ${cmd}
-scripts/run_map.py --queue $queue --cmd $cmd --list $listfn --num_jobs 200 --args "$lang $geo_bb"
+scripts/run_map.py --queue $queue --cmd $cmd --list $listfn --num_jobs 200 --args "$lang $geo_bb $workers"
 
 # 
 # List of serialized tweets
@@ -0,0 +1,136 @@
+#!/usr/bin/env python
+#
+# Copyright (c) 2015
+# Massachusetts Institute of Technology
+#
+# All Rights Reserved
+#
+
+#
+# Equivalence checks for the fast paths: each must give the same output as
+# its reference (or one-at-a-time) path on the tweets of the input files.
+# Run from this directory: python check_reference.py [--input_file ...]
+# AssertionError on the first output that differs
+#
+
+import argparse
+import os
+import get_counts
+import tweet_to_dict as ttd
+import tweet_normalize_msg as tnm
+import tweet_simple_metadata as tsm
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'twitter', 'user_tweets')
+INPUT_FILES = [os.path.join(DATA_DIR, fn) for fn in ['aallan.tweets.tsv.gz', 'aabdullah91.tweets.tsv.gz', 'aaghbal.tweets.tsv.gz']]
+
+def read_msgs (input_files):
+    msgs = []
+    for input_file in input_files:
+        infile = ttd.open_tweet_file(input_file)
+        msgs.extend([xact['msg'] for xact in ttd.read_tweets(infile)])
+        infile.close()
+    return msgs
+
+def check_parse (input_files):
+    # read_tweets_parallel == read_tweets, records and stats, with and
+    # without the language prefilter; small blocks so each file is split
+    num = 0
+    for input_file in input_files:
+        for tgt_lang in (None, 'en'):
+            (stats, stats_par) = ({}, {})
+            infile = ttd.open_tweet_file(input_file)
+            ref = list(ttd.read_tweets(infile, tgt_lang, None, stats))
+            infile.close()
+            infile = ttd.open_raw_tweet_file(input_file)
+            out = list(ttd.read_tweets_parallel(infile, tgt_lang, None, stats_par, 2, 64*1024))
+            infile.close()
+            assert (out == ref), 'read_tweets_parallel differs on {} (lang {})'.format(input_file, tgt_lang)
+            assert (stats_par == stats), 'read_tweets_parallel stats differ on {}: {} vs {}'.format(input_file, stats_par, stats)
+            num += len(ref)
+    return num
+
+def check_normalize (msgs):
+    # split == split_reference, normalize == normalize_reference and
+    # convertUTF8_to_ascii == convertUTF8_to_ascii_reference on each sentence
+    h = get_counts.create_utf8_rewrite_hash()
+    num = 0
+    for msg in msgs:
+        sents = get_counts.split(msg)
+        ref = get_counts.split_reference(msg)
+        assert (sents == ref), 'split differs on {!r}: {!r} vs {!r}'.format(msg, sents, ref)
+        for sent in sents:
+            out = get_counts.convertUTF8_to_ascii(sent, h)
+            ref = get_counts.convertUTF8_to_ascii_reference(sent, h)
+            assert (out == ref), 'convertUTF8_to_ascii differs on {!r}: {!r} vs {!r}'.format(sent, out, ref)
+            out = get_counts.normalize(sent, h)
+            ref = get_counts.normalize_reference(sent, h)
+            assert (out == ref), 'normalize differs on {!r}: {!r} vs {!r}'.format(sent, out, ref)
+            num += 1
+    return num
+
+def check_normalize_batch (msgs):
+    # normalize_batch, cached and pooled, == normalize_msg for each profile;
+    # the messages go in twice so the second pass comes from the cache
+    h = get_counts.create_utf8_rewrite_hash()
+    for profile in sorted(get_counts.PROFILES):
+        ref = [tnm.normalize_msg(msg, h, profile) for msg in msgs] * 2
+        for (workers, cache) in [(1, tnm.NormalizerCache()), (2, None), (2, tnm.NormalizerCache(1000))]:
+            out = list(tnm.normalize_batch(msgs * 2, workers, 500, cache, profile))
+            assert (out == ref), 'normalize_batch differs, profile {}, workers {}, cache {}'.format(profile, workers, cache != None)
+    return len(msgs)
+
+def check_metadata (msgs):
+    # extract_simple_metadata and extract_batch (serial and pooled) ==
+    # extract_simple_metadata_reference
+    ref = [{'msg': msg} for msg in msgs]
+    for value in ref:
+        tsm.extract_simple_metadata_reference(value)
+    out = [{'msg': msg} for msg in msgs]
+    for value in out:
+        tsm.extract_simple_metadata(value)
+    for (a, b) in zip(out, ref):
+        assert (a == b), 'extract_simple_metadata differs: {!r} vs {!r}'.format(a, b)
+    for workers in (1, 2):
+        out = [{'msg': msg} for msg in msgs]
+        tsm.extract_batch(msgs, workers, 500).apply(out)
+        for (a, b) in zip(out, ref):
+            assert (a == b), 'extract_batch (workers {}) differs: {!r} vs {!r}'.format(workers, a, b)
+    return len(msgs)
+
+def check_lid (msgs):
+    # lid_batch == lid_msg, classify_batch == classify, and the same top
+    # language from each langid scoring path
+    import tweet_lid as tlid  # pulls in the langid model
+    from langid import langid
+    msgs = list(tnm.normalize_batch(msgs))
+    out = tlid.lid_batch(msgs)
+    ref = [tlid.lid_msg(msg) for msg in msgs]
+    assert (out == ref), 'lid_batch differs on {} of {} messages'.format(sum([1 for (a, b) in zip(out, ref) if (a != b)]), len(msgs))
+    ident = langid.identifier
+    scoring = ident.scoring
+    try:
+        ref = None
+        for name in ('dense', 'sparse', 'states'):
+            ident.scoring = name
+            one = [ident.classify(msg)[0] for msg in msgs]
+            batch = [lang for (lang, conf) in ident.classify_batch(msgs)]
+            assert (batch == one), 'classify_batch differs from classify, scoring {}'.format(name)
+            if (ref == None):
+                ref = one
+            assert (one == ref), 'classify with scoring {} differs from dense'.format(name)
+    finally:
+        ident.scoring = scoring
+    return len(msgs)
+
+# Main driver: command line interface
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Check the fast paths against their reference outputs")
+    parser.add_argument("--input_file", nargs='+', help="tweet tsv.gz files to check on (default: a few from twitter/user_tweets)", default=INPUT_FILES)
+    args = parser.parse_args()
+
+    print "read_tweets_parallel == read_tweets on {} tweets".format(check_parse(args.input_file))
+    msgs = read_msgs(args.input_file)
+    print "normalize == normalize_reference on {} sentences".format(check_normalize(msgs))
+    print "normalize_batch == normalize_msg on {} tweets".format(check_normalize_batch(msgs))
+    print "extract_simple_metadata == extract_simple_metadata_reference on {} tweets".format(check_metadata(msgs))
+    print "lid_batch == lid_msg on {} tweets".format(check_lid(msgs))
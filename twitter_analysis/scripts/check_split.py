@@ -0,0 +1,69 @@
+#!/usr/bin/env python
+#
+# Copyright (c) 2015
+# Massachusetts Institute of Technology
+#
+# All Rights Reserved
+#
+
+#
+# Edge cases for the sentence splitter: get_counts.split (the isplit scan)
+# must give the same sentences as split_reference on each, both as unicode
+# and as utf-8 bytes.  Run from this directory: python check_split.py
+#
+
+import get_counts as gc
+
+CASES = [
+    u'',
+    u' ',
+    u'.',
+    u'."',
+    u'He said "stop."',
+    u'He said "stop." Then left',
+    u'"."',
+    u'.".".',
+    u'a."b',
+    u'!?',
+    u'What!? Really?! Yes',
+    u'?! ',
+    u'...',
+    u'Wait... what. ',
+    u'\n',
+    u'\n\n',
+    u'one\n\ntwo',
+    u'one\r\ntwo',
+    u'end. ',
+    u'end.  ',
+    u'end. \n',
+    u'end! ',
+    u'end? ',
+    u'  lead. trail  ',
+    u'\ttab. \tstart',
+    u'nbsp.\xa0next',
+    u'nbsp. \xa0next',
+    u'\xa0\xa0lead. x',
+    u'ideographic.\u3000next. \u3000x',
+    u'line sep\u2028next',
+    u'para sep. \u2029next',
+    u'nel\x85next',
+    u'file sep\x1cnext',
+    u'thin\u2009space. \u2009x',
+    u'Dr. Who. ."',
+    u'caf\xe9. na\xefve! ok',
+]
+
+def check_split ():
+    # Number of cases, AssertionError on the first that differs
+    num = 0
+    for case in CASES:
+        for ln in (case, case.encode('utf-8')):
+            out = gc.split(ln)
+            ref = gc.split_reference(ln)
+            assert (out == ref), 'split differs on {!r}: {!r} vs {!r}'.format(ln, out, ref)
+            num += 1
+    return num
+
+# Main driver: command line interface
+if __name__ == '__main__':
+    print "split == split_reference on {} cases".format(check_split())
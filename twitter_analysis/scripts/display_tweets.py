@@ -38,16 +38,13 @@ if __name__ == '__main__':
         (ky1, ky2) = key_search.split("=")
 
     print 'Reading in file: {}'.format(input_file)
-    transactions = tt.load_tweets(input_file)
-    print 'Done'
 
     if (output_file==None):
         outfile = codecs.getwriter('utf-8')(sys.stdout)
     else:
         outfile = codecs.open(output_file, 'w', encoding='utf-8')
 
-    for key in transactions.keys():
-        value = transactions[key]
+    for (key, value) in tt.iter_tweets(input_file):
         if (key_search!=None):
             if (value.has_key(ky1)):
                 if (value[ky1] != ky2):
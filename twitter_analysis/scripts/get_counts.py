@@ -15,9 +15,11 @@
 
 import argparse
 import tweet_tools as tt
+import tweet_strtab as tst
 import sys
 import codecs
 import re
+import time
 from datetime import datetime
 
 def get_counts (msg):
@@ -41,8 +43,37 @@ def remove_repeats (msg):
 
     return msg
 
+# Sentence breaks: after '. ', '? ' or '! ' (the space is dropped), after '."',
+# and at a newline (dropped)
+_sentence_break = re.compile(r'[.?!] |\."|\n')
+_ascii_space = ' \t\n\r\f\v'
+
+def isplit (ln):
+    # Sentences of ln one at a time, in one scan for the breaks; the same
+    # sentences as split_reference.  Each is stripped on the right of any
+    # whitespace and on the left of ascii whitespace only, as before.
+    start = 0
+    for m in _sentence_break.finditer(ln):
+        brk = m.group()
+        if (brk == '\n'):
+            end = m.start()
+        elif (brk == '."'):
+            end = m.end()
+        else:
+            end = m.start() + 1
+        s = ln[start:end].rstrip().lstrip(_ascii_space)
+        if (s):
+            yield s
+        start = m.end()
+    s = ln[start:].rstrip().lstrip(_ascii_space)
+    if (s):
+        yield s
+
 def split(ln):
-    # horridly simple splitter
+    return list(isplit(ln))
+
+def split_reference(ln):
+    # horridly simple splitter -- original version of split, kept to check against
     ln = ln.replace(". ", ".\n\n").replace("? ","?\n\n").replace("! ","!\n\n")
     ln = ln.replace('."', '."\n\n')
     f = ln.split("\n")
@@ -54,9 +85,34 @@ def split(ln):
             fout.append(s)
     return fout
 
-def normalize(ln, rewrite_hash):
+def normalize(ln, rewrite_hash, profile='full'):
+    # Compiled version of normalize_reference, see NORMALIZE_RULES below
+    # profile picks the stages that run, see PROFILES; its MESSAGE_STAGES
+    # are left to normalize_joined
+    try:
+        (translit, rules) = _profile_rules[profile]
+    except KeyError:
+        (translit, rules) = _profile_rules.setdefault(profile, compile_profile(profile))
+    if (translit):
+        ln = convertUTF8_to_ascii(ln, rewrite_hash)
+    for (name, rule) in rules:
+        ln = rule(ln)
+    return ln
+
+def normalize_joined(ln, profile='full'):
+    # The MESSAGE_STAGES of profile, on the normalized sentences of a
+    # message joined with spaces (tweet_normalize_msg.normalize_msg)
+    try:
+        (translit, rules) = _message_rules[profile]
+    except KeyError:
+        (translit, rules) = _message_rules.setdefault(profile, compile_profile(profile, True))
+    for (name, rule) in rules:
+        ln = rule(ln)
+    return ln
+
+def normalize_reference(ln, rewrite_hash):
     # Various normalization routines -- pick and choose as needed
-    ln = convertUTF8_to_ascii(ln, rewrite_hash)
+    ln = convertUTF8_to_ascii_reference(ln, rewrite_hash)
     ln = remove_twitter_meta(ln)
     ln = remove_nonsentential_punctuation(ln)
     ln = remove_markup(ln)
@@ -67,7 +123,52 @@ def normalize(ln, rewrite_hash):
         ln = ''
     return ln
 
+class _TranslitTable (dict):
+    # unicode.translate mapping for a rewrite hash: ascii below 0x7f maps to
+    # itself, other characters without a rewrite become a space (and are
+    # remembered, so each new character is looked up once)
+    def __missing__ (self, code):
+        self[code] = u' '
+        return u' '
+
+def _make_translit_table (rewrite_hash):
+    table = _TranslitTable([(i, i) for i in xrange(0x7f)])
+    for (ky, val) in rewrite_hash.iteritems():
+        if (len(ky) == 1) and (ord(ky) >= 0x7f):
+            table[ord(ky)] = unicode(val)
+    return table
+
+# Byte strings: the rewrite hash has no byte keys, so bytes >= 0x7f become spaces
+_byte_translit = ''.join([chr(i) for i in xrange(0x7f)]) + ' '*(256-0x7f)
+
+# id(rewrite_hash) -> (rewrite_hash, table); holding the hash keeps its id unique
+_translit_tables = {}
+
+# Plain ascii text (most of it) is left as is without a translate pass
+_non_ascii = re.compile(u'[^\x00-\x7e]')
+
 def convertUTF8_to_ascii(ln, rewrite_hash):
+    # Same output as convertUTF8_to_ascii_reference, one translate pass
+    if (not _non_ascii.search(ln)):
+        out = ln
+    elif isinstance(ln, unicode):
+        entry = _translit_tables.get(id(rewrite_hash))
+        if (entry == None) or (entry[0] is not rewrite_hash):
+            entry = (rewrite_hash, _make_translit_table(rewrite_hash))
+            _translit_tables[id(rewrite_hash)] = entry
+        out = ln.translate(entry[1])
+    else:
+        out = ln.translate(_byte_translit)
+
+    # Clean up extra spaces
+    # Once cleaned, \s+.$ can only match a single space before the last character
+    out = _clean_spaces(out)
+    if (out[-2:-1] == ' '):
+        out = out[:-2] + '.'
+
+    return out
+
+def convertUTF8_to_ascii_reference(ln, rewrite_hash):
     out = ''
     for i in xrange(0,len(ln)):
         if (ord(ln[i]) < 0x7f):
@@ -86,6 +187,10 @@ def convertUTF8_to_ascii(ln, rewrite_hash):
     return out
 
 def create_utf8_rewrite_hash ():
+    # Built once at import and shared by all callers -- do not modify it
+    return _rewrite_hash
+
+def build_utf8_rewrite_hash ():
     # Strictly speaking (and in python) any ascii character >= 128 is not valid
     # This tries to rewrite utf-8 chars to ascii in a rational manner
     rewrite_hash = dict([])
@@ -446,6 +551,8 @@ def create_utf8_rewrite_hash ():
 
     return rewrite_hash
 
+_rewrite_hash = build_utf8_rewrite_hash()
+
 def remove_word_punctuation (ln):
     ln = re.sub("^(\S+)[\.\!\?]", "\g<1>", ln)
     ln = re.sub("\s(\S+)[\.\!\?]", " \g<1>", ln)
@@ -581,6 +688,252 @@ def remove_nonsentential_punctuation (ln):
 
     return ln
 
+# Compiled normalizer
+#
+# normalize() runs the same rules as normalize_reference() in the same order,
+# but as a table compiled once: patterns are precompiled, literal patterns use
+# str.replace, a regex is skipped when a substring it needs is absent, and the
+# ^\s+ / \s+$ / \s+ cleanup after each stage is one collapse and a strip.
+# Rules are only merged or dropped when the output is provably unchanged;
+# e.g. [ID:..] and [id:..] stay separate ("[id:x [ID:y]" differs if fused),
+# as do \sRT\s and ^RT\s ("RT RT x").  tweet_benchmark.py --bench normalize
+# checks the two agree on a corpus.
+#
+# Rules are (name, kind, pattern, replacement, needs); kind is 'sub' (regex),
+# 'literal' (plain text), 'clean' (whitespace cleanup) or 'lower'; needs, if
+# given, is a tuple of substrings at least one of which any match must contain.
+# Names are stage.rule; a profile runs the rules of its stages in table order.
+
+NORMALIZE_RULES = [
+    # remove_twitter_meta
+    ('twitter_meta.at_tags', 'sub', r'\@[a-zA-Z0-9_]+', ' ', ('@',)),
+    ('twitter_meta.rt', 'sub', '\sRT\s', ' ', ('RT',)),
+    ('twitter_meta.rt_start', 'sub', '^RT\s', ' ', ('RT',)),
+    ('twitter_meta.clean', 'clean', None, None, None),
+
+    # remove_nonsentential_punctuation
+    ('punctuation.dash_start', 'sub', '^\-+', '', ('-',)),
+    ('punctuation.dashes', 'sub', '\-\-+', '', ('--',)),
+    ('punctuation.space_dash', 'sub', '\s\-+', '', ('-',)),
+    ('punctuation.tilde', 'literal', '~', ' ', None),
+    ('punctuation.double_quote', 'literal', '"', '', None),
+    ('punctuation.quote_start', 'sub', "^\'+", '', ("'",)),
+    ('punctuation.quote_end', 'sub', "\'+$", '', ("'",)),
+    ('punctuation.quote_space', 'sub', "\'+\s+", ' ', ("'",)),
+    ('punctuation.space_quote', 'sub', "\s+\'+", ' ', ("'",)),
+    ('punctuation.space_backquote', 'sub', "\s+\`+", ' ', ('`',)),
+    ('punctuation.backquote_start', 'sub', "^\`+", ' ', ('`',)),
+    ('punctuation.colon_space', 'sub', "\:\s", " ", (':',)),
+    ('punctuation.colon_end', 'sub', "\:$", "", (':',)),
+    ('punctuation.semicolon_space', 'sub', '\;\s', ' ', (';',)),
+    ('punctuation.semicolon_end', 'sub', '\;$', '', (';',)),
+    ('punctuation.underscore_space', 'sub', '\_+\s', ' ', ('_',)),
+    ('punctuation.underscore_start', 'sub', '^\_+', '', ('_',)),
+    ('punctuation.underscore_end', 'sub', '_+$', '', ('_',)),
+    ('punctuation.underscores', 'sub', '\_\_+', ' ', ('__',)),
+    ('punctuation.comma_word', 'sub', '\,+([\#A-Za-z])', ' \g<1>', (',',)),
+    ('punctuation.comma_end', 'sub', '\,+$', ' ', (',',)),
+    ('punctuation.comma_period', 'sub', '\,\.\s', ' ', (',.',)),
+    ('punctuation.comma_space', 'sub', '\,\s', ' ', (',',)),
+    ('punctuation.space_star', 'sub', '\s\*+', ' ', ('*',)),
+    ('punctuation.star_space', 'sub', '\*+\s', ' ', ('*',)),
+    ('punctuation.star_period', 'sub', '\*\.', ' ', ('*.',)),
+    ('punctuation.space_star_space', 'sub', '\s\*+\s', ' ', ('*',)),
+    ('punctuation.star_start', 'sub', '^\*+', '', ('*',)),
+    ('punctuation.star_end', 'sub', '\*+$', '', ('*',)),
+    ('punctuation.question', 'sub', '\?[\!\?]+', '?', ('?',)),
+    ('punctuation.exclamation', 'sub', '\![\?\!]+', '!', ('!',)),
+    ('punctuation.periods', 'sub', '\.\.+', '.', ('..',)),
+    ('punctuation.space_slash', 'sub', '\s\/', ' ', ('/',)),
+    ('punctuation.slash_space', 'sub', '\/\s', ' ', ('/',)),
+    ('punctuation.bar', 'literal', '|', ' ', None),
+    ('punctuation.backslash', 'literal', '\\', ' ', None),
+    ('punctuation.open_paren', 'sub', '\(([@\#A-Za-z0-9])', '\g<1>', ('(',)),
+    ('punctuation.close_paren', 'sub', '([@\#A-Za-z0-9])\)', '\g<1> ', (')',)),
+    ('punctuation.clean', 'clean', None, None, None),
+
+    # remove_markup
+    ('markup.tags', 'sub', '\<\S+\>', ' ', ('<',)),
+    ('markup.url', 'sub', 'https?:\/\/?\s*\S+\s', ' ', ('http',)),
+    ('markup.url_end', 'sub', 'https?:\/\/?\s*\S+$', '', ('http',)),
+    ('markup.url_paren', 'sub', '\(https?:\\\\\S+\)', ' ', ('(http',)),
+    ('markup.www', 'sub', '\(?www\.\S+\)?', ' ', ('www.',)),
+    ('markup.id_upper', 'sub', '\[ID:[^\]]+\]', ' ', ('[ID:',)),
+    ('markup.id_lower', 'sub', '\[id:[^\]]+\]', ' ', ('[id:',)),
+    ('markup.pdf', 'literal', '(PDF)', ' ', None),
+    ('markup.mdash', 'literal', '&mdash;', ' ', None),
+    ('markup.quot', 'literal', '&quot;', ' ', None),
+    ('markup.apostrophe', 'literal', '&#39;', ' ', None),
+    ('markup.clean', 'clean', None, None, None),
+
+    # remove_repeats -- its input is already cleaned and no rule here can
+    # create whitespace, so normalize's final \s+ pass is not needed
+    ('repeats.chars', 'sub', r"(.)\1{2,}", r"\1\1\1", None),
+    ('repeats.ja', 'sub', r"(ja|Ja)(ja|Ja)+(j)?", r"jaja", ('ja', 'Ja')),
+    ('repeats.rs', 'sub', r"(rs|Rs)(Rs|rs)+(r)?", r"rsrs", ('rs', 'Rs')),
+    ('repeats.ha', 'sub', r"(ha|Ha)(Ha|ha)+(h)?", r"haha", ('ha', 'Ha')),
+
+    # Not in normalize_reference: what get_counts does to msg_norm before counting
+    ('lowercase.lower', 'lower', None, None, None),
+
+    # remove_word_punctuation
+    ('word_punctuation.start', 'sub', "^(\S+)[\.\!\?]", "\g<1>", ('.', '!', '?')),
+    ('word_punctuation.inner', 'sub', "\s(\S+)[\.\!\?]", " \g<1>", ('.', '!', '?')),
+    ('word_punctuation.end', 'sub', "(\S+)[\.\!\?]$", "\g<1>", ('.', '!', '?')),
+    ('word_punctuation.alone', 'sub', "\s[\.\!\?]\s", " ", ('.', '!', '?')),
+    ('word_punctuation.only', 'sub', "^[\.\!\?]$", "", ('.', '!', '?')),
+    ('word_punctuation.clean', 'clean', None, None, None),
+]
+
+# Normalization profiles: stages to run ('translit' is convertUTF8_to_ascii, first)
+#   full        -- normalize_reference
+#   minimal     -- only @mentions, RT markers, URLs and markup removed
+#   lid         -- minimal plus repeat squashing; accents kept for language id
+#   topic-model -- full, then lowercased and with word-final . ! ? removed,
+#                  the same as get_counts does to msg_norm before counting
+PROFILES = {
+    'full': ('translit', 'twitter_meta', 'punctuation', 'markup', 'repeats'),
+    'minimal': ('twitter_meta', 'markup'),
+    'lid': ('twitter_meta', 'markup', 'repeats'),
+    'topic-model': ('translit', 'twitter_meta', 'punctuation', 'markup', 'repeats', 'lowercase', 'word_punctuation'),
+}
+
+# Stages run once on the whole message, its normalized sentences joined,
+# rather than on each sentence: word_punctuation differs at the joins
+MESSAGE_STAGES = ('lowercase', 'word_punctuation')
+
+# Whitespace runs other than a lone space -- those are already clean
+_spaces = re.compile('[\t\n\r\f\v]\s*| \s+')
+
+def _clean_spaces (ln):
+    # Same as removing ^\s+ and \s+$ then collapsing \s+ to ' '
+    return _spaces.sub(' ', ln).strip(' ')
+
+def compile_rule (kind, pattern, repl, needs):
+    # One normalization rule as a function of the line
+    if (kind == 'clean'):
+        return _clean_spaces
+    if (kind == 'lower'):
+        return lambda ln: ln.lower()
+    if (kind == 'literal'):
+        return lambda ln: ln.replace(pattern, repl)
+    sub = re.compile(pattern).sub
+    if (needs == None):
+        return lambda ln: sub(repl, ln)
+    def rule (ln):
+        for s in needs:
+            if (s in ln):
+                return sub(repl, ln)
+        return ln
+    return rule
+
+def compile_rules (rules):
+    return [(name, compile_rule(kind, pattern, repl, needs)) for (name, kind, pattern, repl, needs) in rules]
+
+def compile_profile (profile, message=False):
+    # (transliterate?, compiled rules) for the per-sentence stages of a
+    # profile, or with message=True for its MESSAGE_STAGES
+    if (profile not in PROFILES):
+        raise ValueError('get_counts: unknown normalization profile {}'.format(profile))
+    stages = [stage for stage in PROFILES[profile] if ((stage in MESSAGE_STAGES) == message)]
+    rules = [rule for rule in NORMALIZE_RULES if rule[0].split('.')[0] in stages]
+    if (_rule_profiler != None):
+        return (False, instrument_rules('translit' in stages, rules, _rule_profiler))
+    return ('translit' in stages, compile_rules(rules))
+
+# profile -> compile_profile(profile), filled on first use
+_profile_rules = {}
+# profile -> compile_profile(profile, True)
+_message_rules = {}
+
+# Rule profiling (opt-in)
+#
+# While a RuleProfiler is set with profile_rules(), profiles compile to
+# instrumented rules that count and time each call into it, so a run shows
+# which rules fire and what they cost on real data; normalize() itself is
+# unchanged and pays nothing when profiling is off.  Per rule:
+#   calls    -- lines the rule was given
+#   skipped  -- of those, lines without any of its needs, where the regex never ran
+#   changed  -- lines the rule changed
+#   matches  -- substitutions made (for clean/lower rules, lines changed)
+#   secs     -- time in the rule, including the needs check
+# translit is timed as a rule of its own, with the shared rewrite hash.
+# Timing each call adds overhead of its own; compare rules against each
+# other rather than with an uninstrumented run.
+
+_rule_profiler = None
+
+class RuleProfiler (object):
+
+    def __init__ (self):
+        self.stats = {}
+
+    def rule_stats (self, name):
+        if (name not in self.stats):
+            self.stats[name] = {'calls': 0, 'skipped': 0, 'changed': 0, 'matches': 0, 'secs': 0.0}
+        return self.stats[name]
+
+    def report (self):
+        # One line per rule, most time first
+        total = sum([st['secs'] for st in self.stats.itervalues()]) or 1.0
+        lines = ["{:<36} {:>9} {:>9} {:>9} {:>9} {:>8} {:>7} {:>10}".format('rule', 'calls', 'skipped', 'changed', 'matches', 'secs', '% time', 'usec/call')]
+        for (name, st) in sorted(self.stats.iteritems(), key=lambda item: -item[1]['secs']):
+            usec = 1e6 * st['secs'] / max(st['calls'], 1)
+            lines.append("{:<36} {:>9} {:>9} {:>9} {:>9} {:>8.3f} {:>7.1f} {:>10.2f}".format(name, st['calls'], st['skipped'], st['changed'], st['matches'], st['secs'], 100.0*st['secs']/total, usec))
+        return '\n'.join(lines)
+
+def profile_rules (profiler):
+    # Start recording into profiler (a RuleProfiler), or stop with None
+    global _rule_profiler
+    _rule_profiler = profiler
+    _profile_rules.clear()
+    _message_rules.clear()
+
+def instrument_rule (name, kind, pattern, repl, needs, profiler):
+    # compile_rule, recording into the profiler's stats for name; kind can
+    # also be 'translit' for convertUTF8_to_ascii
+    stats = profiler.rule_stats(name)
+    if (kind == 'sub'):
+        subn = re.compile(pattern).subn
+        apply_rule = lambda ln: subn(repl, ln)
+    elif (kind == 'literal'):
+        apply_rule = lambda ln: (ln.replace(pattern, repl), ln.count(pattern))
+    else:
+        if (kind == 'translit'):
+            h = create_utf8_rewrite_hash()
+            run = lambda ln: convertUTF8_to_ascii(ln, h)
+        else:
+            run = compile_rule(kind, pattern, repl, needs)
+        def apply_rule (ln):
+            out = run(ln)
+            return (out, int(out != ln))
+    if (kind != 'sub'):
+        # needs only gates regex rules, as in compile_rule
+        needs = None
+    def rule (ln):
+        t0 = time.time()
+        stats['calls'] += 1
+        if (needs != None) and (not any([s in ln for s in needs])):
+            stats['skipped'] += 1
+            out = ln
+        else:
+            (out, count) = apply_rule(ln)
+            stats['matches'] += count
+            if (out != ln):
+                stats['changed'] += 1
+        stats['secs'] += time.time() - t0
+        return out
+    return rule
+
+def instrument_rules (translit, rules, profiler):
+    # compile_rules with every rule instrumented; translit becomes the first rule
+    out = []
+    if (translit):
+        out.append(('translit', instrument_rule('translit', 'translit', None, None, None, profiler)))
+    for (name, kind, pattern, repl, needs) in rules:
+        out.append((name, instrument_rule(name, kind, pattern, repl, needs, profiler)))
+    return out
+
 # Main driver: command line interface
 if __name__ == '__main__':
 
@@ -591,6 +944,7 @@ if __name__ == '__main__':
     parser.add_argument("--output_counts", help="text output file", type=str, required=False)
     parser.add_argument("--key", help="key of the form key=value, e.g. lid_lui=fr", type=str)
     parser.add_argument("--output_date", help="mapping of file to data", type=str, required=False)
+    parser.add_argument("--profile", help="re-normalize msg with this profile instead of using the stored msg_norm", type=str, required=False, choices=sorted(PROFILES))
     args = parser.parse_args()
     list_fn = args.list
     out_msg_fn = args.output_msg
@@ -610,6 +964,16 @@ if __name__ == '__main__':
     if (out_cnt_fn!=None):
         out_cnt_file = codecs.open(out_cnt_fn, 'w', encoding='ascii', errors='ignore')
 
+    # Only these fields are decoded from the serialized tweets
+    # user_sid, in files ingested with --strtab, names the user through the
+    # file's string table; userid is only read for records without one
+    count_fields = ['msg_norm', 'userid', 'date', 'user_sid']
+    if (key_search!=None):
+        count_fields.append(ky1)
+    if (args.profile!=None):
+        import tweet_normalize_msg as tnm
+        count_fields.append('msg')
+
     # Create UTF8 -> ascii hash
     rewrite_hash = create_utf8_rewrite_hash()
 
@@ -618,11 +982,8 @@ if __name__ == '__main__':
         input_file = input_file.rstrip()
 
         print 'Reading in file: {}'.format(input_file)
-        transactions = tt.load_tweets(input_file)
-        print 'Done'
-
-        for key in transactions.keys():
-            value = transactions[key]
+        names = tst.load_tweet_strtab(input_file)
+        for (key, value) in tt.iter_tweets(input_file, count_fields):
             if (key_search!=None):
                 if (value.has_key(ky1)):
                     if (value[ky1] != ky2):
@@ -636,9 +997,17 @@ if __name__ == '__main__':
                 dt_python = datetime.strptime(dt, fmt_in)
                 dt = dt_python.strftime(fmt_out)
                 out_date_file.write('{} {}\n'.format(key + ".counts", dt))
-            msg_norm = [remove_word_punctuation(value['msg_norm'].lower())]
+            if (args.profile!=None):
+                # The profile output is used as is
+                msg_norm = [tnm.normalize_msg(value['msg'], rewrite_hash, args.profile)]
+            else:
+                msg_norm = [remove_word_punctuation(value['msg_norm'].lower())]
             if (out_cnt_fn!=None):
-                user_id = value['userid'].lower()
+                if (names != None) and (value.has_key('user_sid')):
+                    # Table entries are '@' + the lower-cased userid
+                    user_id = names[value['user_sid']][1:]
+                else:
+                    user_id = value['userid'].lower()
                 counts = get_counts(msg_norm)
                 out_cnt_file.write(u"{} {}".format(key, user_id))
                 for w in sorted(counts):
@@ -1 +1 @@
-from langid import classify, rank
+from langid import classify, rank, classify_batch, rank_batch
@@ -18,10 +18,10 @@ import gzip
 import os
 import shutil
 import sys
+import tweet_reader as trd
 
 def read_nodes(fn):
-    zf_raw = gzip.open(fn,'r')
-    zf = codecs.getreader('utf-8')(zf_raw)
+    zf = trd.open_lines(fn, compressed=True)
     nodes = {}
     max_id = -1
     for ln in zf:
@@ -34,8 +34,7 @@ def read_nodes(fn):
     return (nodes, max_id)
 
 def merge_nodes(fn, nodes, id_start):
-    zf_raw = gzip.open(fn, 'r')
-    zf = codecs.getreader('utf-8')(zf_raw)
+    zf = trd.open_lines(fn, compressed=True)
     node_map = {}
     for ln in zf:
         f = ln.rstrip().split()
@@ -52,8 +51,7 @@ def merge_nodes(fn, nodes, id_start):
     return (nodes, node_map, id_start)
 
 def map_edges(fn, output_file, node_map):
-    zf_raw = gzip.open(fn, 'r')
-    zf = codecs.getreader('utf-8')(zf_raw)
+    zf = trd.open_lines(fn, compressed=True)
     for ln in zf:
         f = ln.rstrip().split()
         f[0] = int(f[0])
@@ -65,8 +63,7 @@ def map_edges(fn, output_file, node_map):
 def merge_edges(fn_edges_tmp, fn_edges):
     # Read in edges and merge
     edges = {}
-    zf_raw = gzip.open(fn_edges_tmp, 'r')
-    zf = codecs.getreader('utf-8')(zf_raw)
+    zf = trd.open_lines(fn_edges_tmp, compressed=True)
     for ln in zf:
         f = ln.rstrip().split()
         r = [int(x) for x in f]
@@ -125,9 +122,10 @@ if __name__ == '__main__':
             print "Done"
             sys.stdout.flush()
             print "Reading in first set of edges ..."
-            f = gzip.open(fn[1], 'r')
-            for ln in f:
-                output_edges_tmp.write(ln)
+            f = trd.open_raw(fn[1], compressed=True)
+            for block in trd.read_chunks(f, trd.BLOCK_BYTES):
+                output_edges_tmp.write(block)
+            f.close()
             print "Done"
             sys.stdout.flush()
             first = False
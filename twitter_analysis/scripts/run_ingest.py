@@ -15,18 +15,31 @@
 
 import argparse
 import glob
+import itertools
+import multiprocessing
 import os
-import tweet_tools as tt 
-import tweet_simple_metadata as tsm
-import tweet_lid as tlid
-import tweet_normalize_msg as tnm
+import shutil
+import tweet_pipeline as tp
+import tweet_regions as tr
+import tweet_manifest as tm
+import tweet_strtab as tst
 
 parser = argparse.ArgumentParser(description="Run splits of ")
 parser.add_argument("--list", type=str, required=True)
 parser.add_argument("--lang", type=str, required=False)
 parser.add_argument("--geo_bounding_box", type=str, required=False)
+parser.add_argument("--regions", type=str, required=False, help="file of region boxes/polygons, keep and tag tweets inside any region")
+parser.add_argument("--lid", action='store_true', default=False)
+parser.add_argument("--workers", type=int, default=1, help="number of input files to ingest in parallel")
+parser.add_argument("--norm_workers", type=int, default=1, help="number of processes normalizing each file, with --workers 1")
+parser.add_argument("--format", type=str, default='pickle', choices=['pickle', 'columnar'], help="serialized output format")
+parser.add_argument("--strtab", action='store_true', default=False, help="add interned user/hashtag ids, with a .strtab table next to each output")
 args = parser.parse_args()
 print 'args is : {}'.format(args)
+if (args.workers > 1) and (args.norm_workers > 1):
+    # Pool workers cannot start pools of their own
+    print "Use either --workers or --norm_workers, not both"
+    exit(1)
 listfn = args.list
 
 destdir = 'twitter/serialized'
@@ -35,54 +48,119 @@ bounding_box = args.geo_bounding_box
 tmpdir = 'tmp/'
 debug = 0  # set to 1 for more info and a smaller processing set
 
-additional_args = ""
-if (tgt_lang!=None):
-    additional_args += "--lang {} ".format(tgt_lang)
+out_ext = {'pickle': '.pckl', 'columnar': '.tcol'}[args.format]
+
 if (bounding_box!=None):
-    additional_args += "--bounding_box={}".format(bounding_box)
+    bounding_box = tuple([float(x) for x in bounding_box.split(",")])
+regions = None
+if (args.regions!=None):
+    regions = tr.load_regions(args.regions)
 
 if (not os.path.exists(destdir)):
     os.makedirs(destdir)
-
+if (not os.path.exists(tmpdir)):
+    os.makedirs(tmpdir)
+
+# Per-input progress and status, see tweet_manifest.py
+manifest = tm.Manifest(os.path.join(destdir, 'manifest'))
+options = {'lang': tgt_lang, 'bounding_box': bounding_box and list(bounding_box), 'regions': args.regions,
+           'lid': args.lid, 'format': args.format}
+if (args.strtab):
+    # Only when set, so entries made before the option still match
+    options['strtab'] = True
+
+# Build the list of inputs still to do
+jobs = []
+num_failed = 0
 listfile = open(listfn, 'r')
 for fn in listfile:
 
-    # Run initial raw to hash format -- output is serialized to pickle
-    # So the output is pickled tweets (!)
+    # Raw tsv to serialized tweets with metadata -- output is pickled (.pckl) or columnar (.tcol) tweets
     fn = fn.rstrip()
-    out_fn = 'tw_' + os.path.basename(os.path.dirname(fn)) + '_' + os.path.basename(fn).split('.')[0] + '.pckl'
+    out_fn = 'tw_' + os.path.basename(os.path.dirname(fn)) + '_' + os.path.basename(fn).split('.')[0] + out_ext
     outfile = os.path.join(destdir, out_fn)
     print 'outfile name is : {}'.format(outfile)
 
-    if (os.path.exists(outfile)):
+    # Written to tmp first so a partial file is never taken as done
+    tmpfile = os.path.join(tmpdir, out_fn)
+    entry = manifest.get(out_fn)
+    if (entry == None) and (os.path.exists(outfile)):
+        # Made before there was a manifest
         print "Outfile already exists, skipping ..., delete to regenerate: {}".format(outfile)
         continue
-    tmpfile = os.path.join(tmpdir, out_fn)
-    cmd = "scripts/tweet_to_dict.py --in {} --out {} --verbose {} {}".format(fn, tmpfile, debug, additional_args)
-    print "Running command: {}".format(cmd)
-    os.system(cmd)
-
-    # Now add simple metadata -- at tags, hashtags, links
-    print "Adding simple metadata ..."
-    transactions = tt.load_tweets(tmpfile)
-    os.unlink(tmpfile)
-    tsm.add_simple_metadata(transactions, debug)
-
-    # Normalize
-    print "Performing normalization ..."
-    tnm.normalize_msgs(transactions, debug)
-
-    # Language id on text
-    # print "Performing language recognition ..."
-    # tlid.add_lid(transactions, debug)
-
-    # Save it
-    print "Saving to serialized file ... ",
-    print "outfile: {}".format(outfile)
-    tt.save_tweets(transactions, outfile)
-    print "Done"
+    # Only a stat here; an input whose checksum is not known is checksummed
+    # by its worker, see tweet_manifest.Checkpoint.verify_input
+    try:
+        state = tm.input_state(fn, entry)
+    except OSError as e:
+        # Missing or unreadable: fail this input only
+        print "Cannot read input, skipping: {} : {}".format(fn, e.strerror)
+        if (entry == None):
+            entry = {'input': fn, 'output': outfile, 'options': options, 'checksum': None}
+        entry.update(status='failed', lines=0, kept=0, out_bytes=0)
+        manifest.put(out_fn, entry)
+        num_failed += 1
+        continue
+    previous_checksum = None
+    if (entry != None) and (entry['options']==options) and (state['checksum'] in (None, entry['checksum'])):
+        done = (entry['status']=='done') and (os.path.exists(outfile))
+        resumable = (entry['status']=='running') and (os.path.exists(tmpfile)) and (os.path.getsize(tmpfile) >= entry['out_bytes'])
+        if (state['checksum'] == None) and (done or resumable):
+            # Touched, kept if the worker finds the content unchanged
+            print "Input touched, checking: {}".format(fn)
+            previous_checksum = entry['checksum']
+        elif (done):
+            print "Already ingested, skipping ..., delete to regenerate: {}".format(outfile)
+            continue
+        elif (resumable):
+            print "Resuming at line {}: {}".format(entry['lines'], fn)
+        else:
+            entry = None
+    elif (entry != None):
+        print "Input or options changed, reprocessing: {}".format(fn)
+        entry = None
+    if (entry == None):
+        entry = {'input': fn, 'output': outfile, 'options': options, 'status': 'running',
+                 'lines': 0, 'kept': 0, 'out_bytes': 0}
+    entry.update(state)
+    manifest.put(out_fn, entry)
+    checkpoint = tm.Checkpoint(manifest, out_fn, entry, previous_checksum)
+    jobs.append(((fn, tmpfile, tgt_lang, bounding_box, args.lid, debug, 1, args.format, regions, checkpoint, args.norm_workers, args.strtab), outfile, checkpoint))
 
     if (debug > 0):
         break
 
 listfile.close()
+
+# Parse, filter, add metadata, normalize and save in one streaming pass per file
+# Results come back in list order and each output is moved into place only
+# once its file is complete
+if (args.workers > 1):
+    pool = multiprocessing.Pool(args.workers)
+    results = pool.imap(tp.ingest_job, [job for (job, job_outfile, job_checkpoint) in jobs], 1)
+else:
+    pool = None
+    results = (tp.ingest_job(job) for (job, job_outfile, job_checkpoint) in jobs)
+
+num_inputs = len(jobs) + num_failed
+for ((job, outfile, checkpoint), (stats, err)) in itertools.izip(jobs, results):
+    if (err != None):
+        print "Ingest failed for {}:\n{}".format(job[0], err)
+        checkpoint.update(status='failed', lines=0, kept=0, out_bytes=0)
+        num_failed += 1
+        continue
+    if (stats == None):
+        print "Input unchanged, skipping ..., delete to regenerate: {}".format(outfile)
+        continue
+    print "Ingested: {}, kept {} of {} lines".format(job[0], stats['kept'], stats['lines'])
+    print "outfile: {}".format(outfile)
+    if (args.strtab):
+        # Table first, so an output in place always has its table
+        shutil.move(tst.strtab_file(job[1]), tst.strtab_file(outfile))
+    shutil.move(job[1], outfile)
+    checkpoint.update(status='done', checksum=stats['checksum'], lines=stats['lines'], kept=stats['kept'], out_bytes=os.path.getsize(outfile))
+
+if (pool != None):
+    pool.close()
+    pool.join()
+print "Done, {} of {} files failed".format(num_failed, num_inputs)
@@ -0,0 +1,328 @@
+#!/usr/bin/env python
+#
+# Copyright (c) 2015
+# Massachusetts Institute of Technology
+#
+# All Rights Reserved
+#
+
+#
+# Timing benchmarks for the ingest and normalization tools
+# e.g. scripts/tweet_benchmark.py --bench parse --input_file twitter/user_tweets/aallan.tweets.tsv.gz --workers 1,2,4
+#
+
+import argparse
+import codecs
+import gc
+import gzip
+import itertools
+import random
+import sys
+import time
+import tweet_to_dict as ttd
+import get_counts
+import tweet_normalize_msg as tnm
+import tweet_pipeline as tp
+import tweet_regions as tr
+import tweet_simple_metadata as tsm
+import tweet_reader as trd
+from tweet_record import Tweet
+
+def bench_parse (input_file, workers_list, tgt_lang=None, bounding_box=None):
+    # lines/sec of tweet_to_dict parsing + filtering as the worker count grows
+    # workers=1 is the serial path, reading lines through tweet_reader
+    print "{:>8} {:>10} {:>8} {:>12}".format('workers', 'lines', 'secs', 'lines/sec')
+    for workers in workers_list:
+        stats = {}
+        t0 = time.time()
+        if (workers > 1):
+            infile = ttd.open_raw_tweet_file(input_file)
+            xacts = ttd.read_tweets_parallel(infile, tgt_lang, bounding_box, stats, workers)
+        else:
+            infile = ttd.open_tweet_file(input_file)
+            xacts = ttd.read_tweets(infile, tgt_lang, bounding_box, stats)
+        for xact in xacts:
+            pass
+        infile.close()
+        dt = time.time() - t0
+        print "{:>8} {:>10} {:>8.2f} {:>12.0f} ({} kept)".format(workers, stats['lines'], dt, stats['lines']/dt, stats['kept'])
+
+def bench_read (input_file):
+    # MB/s of decompressed text delivered as unicode lines: the old codecs
+    # reader on gzip vs tweet_reader with a helper thread / external process
+    raw = ttd.open_raw_tweet_file(input_file)
+    num_bytes = len(raw.read())
+    raw.close()
+    readers = [('codecs', lambda: codecs.getreader('utf-8')(gzip.open(input_file, 'r'))),
+               ('thread', lambda: trd.LineReader(trd.BlockReader(input_file, external=False))),
+               ('external', lambda: trd.LineReader(trd.BlockReader(input_file, external=True)))]
+    print "{:>10} {:>10} {:>8} {:>8}".format('reader', 'lines', 'secs', 'MB/s')
+    for (name, open_fn) in readers:
+        t0 = time.time()
+        infile = open_fn()
+        num_lines = 0
+        for ln in infile:
+            num_lines += 1
+        infile.close()
+        dt = time.time() - t0
+        print "{:>10} {:>10} {:>8.2f} {:>8.1f}".format(name, num_lines, dt, num_bytes/dt/1e6)
+
+def bench_normalize (input_file):
+    # tweets/sec of sentence splitting, split_reference vs split, and of
+    # message normalization, normalize_reference (the rule chain) vs
+    # normalize (compiled rule table), each with the number of outputs
+    # where the two differ -- should be 0
+    infile = ttd.open_tweet_file(input_file)
+    msgs = [xact['msg'] for xact in ttd.read_tweets(infile)]
+    infile.close()
+    h = get_counts.create_utf8_rewrite_hash()
+    # Sentence splitting, split_reference vs the single scan split
+    print "{:>10} {:>10} {:>8} {:>12}".format('split', 'tweets', 'secs', 'tweets/sec')
+    outputs = {}
+    for (name, split_fn) in [('reference', get_counts.split_reference), ('scan', get_counts.split)]:
+        t0 = time.time()
+        outputs[name] = [split_fn(msg) for msg in msgs]
+        dt = time.time() - t0
+        print "{:>10} {:>10} {:>8.2f} {:>12.0f}".format(name, len(msgs), dt, len(msgs)/dt)
+    num_diff = sum([1 for (a, b) in itertools.izip(outputs['reference'], outputs['scan']) if (a != b)])
+    print "tweets split differently: {}".format(num_diff)
+    sents = outputs['scan']
+    outputs = {}
+    print "{:>10} {:>10} {:>8} {:>12}".format('normalize', 'tweets', 'secs', 'tweets/sec')
+    for (name, norm_fn) in [('reference', get_counts.normalize_reference), ('compiled', get_counts.normalize)]:
+        t0 = time.time()
+        outputs[name] = [[norm_fn(sent, h) for sent in msg_sents] for msg_sents in sents]
+        dt = time.time() - t0
+        print "{:>10} {:>10} {:>8.2f} {:>12.0f}".format(name, len(msgs), dt, len(msgs)/dt)
+    num_diff = 0
+    for (ref, out) in itertools.izip(outputs['reference'], outputs['compiled']):
+        num_diff += sum([1 for (a, b) in itertools.izip(ref, out) if (a != b)])
+    print "sentences differing: {}".format(num_diff)
+    # Whole messages through normalize_batch, without and with the LRU cache
+    print "{:>10} {:>10} {:>8} {:>12}".format('batch', 'tweets', 'secs', 'tweets/sec')
+    for (name, cache) in [('no cache', None), ('cache', tnm.NormalizerCache())]:
+        t0 = time.time()
+        out = list(tnm.normalize_batch(msgs, cache=cache))
+        dt = time.time() - t0
+        print "{:>10} {:>10} {:>8.2f} {:>12.0f}".format(name, len(msgs), dt, len(msgs)/dt)
+    print cache.report()
+    print "{:>12} {:>10} {:>8} {:>12}".format('profile', 'tweets', 'secs', 'tweets/sec')
+    for profile in sorted(get_counts.PROFILES):
+        t0 = time.time()
+        out = list(tnm.normalize_batch(msgs, profile=profile))
+        dt = time.time() - t0
+        print "{:>12} {:>10} {:>8.2f} {:>12.0f}".format(profile, len(msgs), dt, len(msgs)/dt)
+
+def bench_rules (input_file, profile='full'):
+    # Per-rule counts and time for one normalization profile over the
+    # messages of input_file (get_counts.RuleProfiler), and the run time with
+    # and without the instrumentation
+    infile = ttd.open_tweet_file(input_file)
+    msgs = [xact['msg'] for xact in ttd.read_tweets(infile)]
+    infile.close()
+    h = get_counts.create_utf8_rewrite_hash()
+    t0 = time.time()
+    plain = [tnm.normalize_msg(msg, h, profile) for msg in msgs]
+    dt_plain = time.time() - t0
+    profiler = get_counts.RuleProfiler()
+    get_counts.profile_rules(profiler)
+    try:
+        t0 = time.time()
+        profiled = [tnm.normalize_msg(msg, h, profile) for msg in msgs]
+        dt_profiled = time.time() - t0
+    finally:
+        get_counts.profile_rules(None)
+    print profiler.report()
+    print "{} tweets, profile {}: {:.2f} secs plain, {:.2f} secs instrumented, {} outputs differing".format(len(msgs), profile, dt_plain, dt_profiled, sum([1 for (a, b) in itertools.izip(plain, profiled) if (a != b)]))
+
+def bench_metadata (input_file, workers_list):
+    # tweets/sec of entity extraction, extract_simple_metadata_reference (one
+    # regex scan per field) vs extract_simple_metadata (single scan), and the
+    # number of tweets where the fields differ -- should be 0; then
+    # extract_batch into entity columns as the worker count grows
+    infile = ttd.open_tweet_file(input_file)
+    msgs = [xact['msg'] for xact in ttd.read_tweets(infile)]
+    infile.close()
+    outputs = {}
+    print "{:>10} {:>10} {:>8} {:>12}".format('metadata', 'tweets', 'secs', 'tweets/sec')
+    for (name, extract_fn) in [('reference', tsm.extract_simple_metadata_reference), ('single', tsm.extract_simple_metadata)]:
+        values = [{'msg': msg} for msg in msgs]
+        # No cyclic gc while timing, else the reference outputs kept from the
+        # first run slow down the second
+        gc.disable()
+        t0 = time.time()
+        for value in values:
+            extract_fn(value)
+        dt = time.time() - t0
+        gc.enable()
+        outputs[name] = values
+        print "{:>10} {:>10} {:>8.2f} {:>12.0f}".format(name, len(msgs), dt, len(msgs)/dt)
+    num_diff = sum([1 for (a, b) in itertools.izip(outputs['reference'], outputs['single']) if (a != b)])
+    print "tweets differing: {}".format(num_diff)
+    print "{:>10} {:>10} {:>8} {:>12} {:>10}".format('workers', 'tweets', 'secs', 'tweets/sec', 'differing')
+    for workers in workers_list:
+        gc.disable()
+        t0 = time.time()
+        columns = tsm.extract_batch(msgs, workers)
+        dt = time.time() - t0
+        gc.enable()
+        values = [{'msg': msg} for msg in msgs]
+        columns.apply(values)
+        num_diff = sum([1 for (a, b) in itertools.izip(outputs['reference'], values) if (a != b)])
+        print "{:>10} {:>10} {:>8.2f} {:>12.0f} {:>10}".format(workers, len(msgs), dt, len(msgs)/dt, num_diff)
+
+def bench_lid (input_file):
+    # tweets/sec of language id on the normalized messages, one at a time
+    # (lid_msg, langid classify) vs in batches (lid_batch, classify_batch),
+    # and the number of tweets where the answers differ -- should be 0; then
+    # the latency of single calls
+    import tweet_lid as tlid  # pulls in the langid model
+    infile = ttd.open_tweet_file(input_file)
+    msgs = list(tnm.normalize_batch((xact['msg'] for xact in ttd.read_tweets(infile)), 1))
+    infile.close()
+    tlid.lid_batch(msgs[:1])
+    print "{:>16} {:>10} {:>8} {:>12} {:>10}".format('lid', 'tweets', 'secs', 'tweets/sec', 'differing')
+    for (name, one_fn, batch_fn) in [('lid_msg', tlid.lid_msg, tlid.lid_batch), ('classify', tlid.langid.classify, tlid.langid.classify_batch)]:
+        t0 = time.time()
+        one = [one_fn(msg) for msg in msgs]
+        dt_one = time.time() - t0
+        t0 = time.time()
+        batch = batch_fn(msgs)
+        dt_batch = time.time() - t0
+        num_diff = sum([1 for (a, b) in itertools.izip(one, batch) if (a != b)])
+        print "{:>16} {:>10} {:>8.2f} {:>12.0f}".format(name, len(msgs), dt_one, len(msgs)/dt_one)
+        print "{:>16} {:>10} {:>8.2f} {:>12.0f} {:>10}".format(name + ' batch', len(msgs), dt_batch, len(msgs)/dt_batch, num_diff)
+    bench_lid_latency(msgs)
+
+def bench_lid_latency (msgs):
+    # Per-call latency in usec of langid on one message, for each way of
+    # scoring it (LanguageIdentifier.scoring): mean time to map the message
+    # to features (or states) and to score them, then mean/median/99th
+    # percentile of a whole classify call
+    from langid import langid
+    ident = langid.identifier
+    paths = [('dense', ident.instance2fv, ident.nb_classprobs),
+             ('sparse', ident.instance2sparse, lambda fv: ident.nb_sparse_classprobs(*fv)),
+             ('states', ident.instance2states, ident.nb_state_classprobs)]
+    scoring = ident.scoring
+    print "{:>8} {:>8} {:>8} {:>10} {:>8} {:>8}".format('scoring', 'fv', 'probs', 'classify', 'p50', 'p99')
+    for (name, fv_fn, probs_fn) in paths:
+        ident.scoring = name
+        dt_fv = 0.0
+        dt_probs = 0.0
+        for msg in msgs:
+            t0 = time.time()
+            fv = fv_fn(msg)
+            t1 = time.time()
+            probs_fn(fv)
+            dt_fv += t1 - t0
+            dt_probs += time.time() - t1
+        calls = []
+        for msg in msgs:
+            t0 = time.time()
+            ident.classify(msg)
+            calls.append(time.time() - t0)
+        calls.sort()
+        usec = 1e6 / len(msgs)
+        print "{:>8} {:>8.1f} {:>8.1f} {:>10.1f} {:>8.1f} {:>8.1f}".format(name, dt_fv*usec, dt_probs*usec, sum(calls)*usec,
+                                                                        calls[len(calls)/2]*1e6, calls[len(calls)*99/100]*1e6)
+    ident.scoring = scoring
+
+def deep_size (obj, seen):
+    # Bytes held by obj and everything it references, counting shared objects once
+    if (id(obj) in seen):
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        for (ky, val) in obj.iteritems():
+            size += deep_size(ky, seen) + deep_size(val, seen)
+    elif isinstance(obj, (list, tuple)):
+        for val in obj:
+            size += deep_size(val, seen)
+    elif isinstance(obj, Tweet):
+        for ky in obj.__slots__:
+            if (hasattr(obj, ky)):
+                size += deep_size(getattr(obj, ky), seen)
+    return size
+
+def bench_memory (input_file, max_tweets=100000):
+    # Memory per fully annotated tweet (metadata + msg_norm), dict vs Tweet records
+    infile = ttd.open_tweet_file(input_file)
+    xacts = []
+    for xact in ttd.read_tweets(infile, strings={}):
+        xacts.append(xact)
+        if (len(xacts) >= max_tweets):
+            break
+    infile.close()
+    xacts = list(tp.normalize_stage(tp.metadata_stage(xacts, 0), 0))
+    # Baseline: per-tweet dicts, each with its own copy of userid and lid_gnip as before
+    dicts = []
+    for xact in xacts:
+        d = xact.to_dict()
+        d['userid'] = d['userid'][:1] + d['userid'][1:]
+        d['lid_gnip'] = d['lid_gnip'][:1] + d['lid_gnip'][1:]
+        dicts.append(d)
+    dict_size = deep_size(dicts, set()) / float(len(dicts))
+    tweet_size = deep_size(xacts, set()) / float(len(xacts))
+    print "{} tweets".format(len(xacts))
+    print "dict record:  {:.0f} bytes/tweet".format(dict_size)
+    print "Tweet record: {:.0f} bytes/tweet".format(tweet_size)
+
+def bench_regions (input_file, counts):
+    # Region lookups/sec for the grid index vs testing every region, on the
+    # tweet locations in input_file and n random city-sized boxes
+    infile = ttd.open_tweet_file(input_file)
+    geos = [xact['geo'] for xact in ttd.read_tweets(infile)]
+    infile.close()
+    rng = random.Random(0)
+    print "{:>8} {:>14} {:>14}".format('regions', 'grid/sec', 'scan/sec')
+    for n in counts:
+        regions = []
+        for i in xrange(n):
+            lat = rng.uniform(25.0, 50.0)
+            lon = rng.uniform(-125.0, -65.0)
+            regions.append(tr.Region(str(i), i, (lat, lon, lat+0.5, lon+0.5)))
+        index = tr.RegionIndex(regions)
+        t0 = time.time()
+        for geo in geos:
+            index.lookup(geo)
+        dt_grid = time.time() - t0
+        t0 = time.time()
+        for geo in geos:
+            [region.rid for region in regions if region.contains(geo[0], geo[1])]
+        dt_scan = time.time() - t0
+        print "{:>8} {:>14.0f} {:>14.0f}".format(n, len(geos)/dt_grid, len(geos)/dt_scan)
+
+# Main driver: command line interface
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmarks for the Twitter analysis tools.")
+    parser.add_argument("--bench", help="benchmark to run", type=str, required=True, choices=['parse', 'read', 'normalize', 'rules', 'metadata', 'lid', 'memory', 'regions'])
+    parser.add_argument("--input_file", help="input file of tweets", type=str, required=True)
+    parser.add_argument("--workers", help="comma separated list of worker counts", type=str, default="1,2,4,8")
+    parser.add_argument("--lang", help="ISO 639-1 code for target language", type=str, required=False)
+    parser.add_argument("--bounding_box", help="southwest_lat,southwest_long,northeast_lat,northeast_long no spaces", type=str, required=False)
+    parser.add_argument("--profile", help="normalization profile for --bench rules", type=str, default='full', choices=sorted(get_counts.PROFILES))
+    args = parser.parse_args()
+
+    bounding_box = None
+    if (args.bounding_box):
+        bounding_box = tuple([float(x) for x in args.bounding_box.split(",")])
+
+    workers_list = [int(x) for x in args.workers.split(",")]
+    if (args.bench == 'parse'):
+        bench_parse(args.input_file, workers_list, args.lang, bounding_box)
+    elif (args.bench == 'read'):
+        bench_read(args.input_file)
+    elif (args.bench == 'normalize'):
+        bench_normalize(args.input_file)
+    elif (args.bench == 'rules'):
+        bench_rules(args.input_file, args.profile)
+    elif (args.bench == 'metadata'):
+        bench_metadata(args.input_file, workers_list)
+    elif (args.bench == 'lid'):
+        bench_lid(args.input_file)
+    elif (args.bench == 'memory'):
+        bench_memory(args.input_file)
+    elif (args.bench == 'regions'):
+        bench_regions(args.input_file, [10, 100, 1000])
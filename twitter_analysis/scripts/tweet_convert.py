@@ -0,0 +1,49 @@
+#!/usr/bin/env python
+#
+# Copyright (c) 2015
+# Massachusetts Institute of Technology
+#
+# All Rights Reserved
+#
+
+#
+# Convert serialized tweet files between the pickle and columnar formats
+# e.g. existing .pckl files -> memory-mapped .tcol files
+#
+
+import argparse
+import os
+import tweet_tools as tt
+
+EXTENSIONS = {'pickle': '.pckl', 'columnar': '.tcol'}
+
+# Main driver: command line interface
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description="Convert serialized tweet files between formats.")
+    parser.add_argument("--input_file", help="input serialized file of tweets", type=str, required=False)
+    parser.add_argument("--output_file", help="output serialized file of tweets", type=str, required=False)
+    parser.add_argument("--list", help="list of serialized files, each converted next to the original", type=str, required=False)
+    parser.add_argument("--format", help="output format", type=str, default='columnar', choices=tt.FORMATS)
+    args = parser.parse_args()
+
+    files = []
+    if (args.list != None):
+        listfile = open(args.list, 'r')
+        for fn in listfile:
+            fn = fn.rstrip()
+            files.append((fn, os.path.splitext(fn)[0] + EXTENSIONS[args.format]))
+        listfile.close()
+    elif (args.input_file != None and args.output_file != None):
+        files.append((args.input_file, args.output_file))
+    else:
+        print "Need to specify input and output files or a list -- run with --help for syntax"
+        exit(1)
+
+    for (input_file, output_file) in files:
+        if (os.path.exists(output_file)):
+            print "Outfile already exists, skipping ..., delete to regenerate: {}".format(output_file)
+            continue
+        print 'Converting {} -> {}'.format(input_file, output_file)
+        num = tt.convert_tweets(input_file, output_file, args.format)
+        print 'Wrote {} tweets'.format(num)
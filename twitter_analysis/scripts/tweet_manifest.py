@@ -0,0 +1,112 @@
+#!/usr/bin/env python
+#
+# Copyright (c) 2015
+# Massachusetts Institute of Technology
+#
+# All Rights Reserved
+#
+
+#
+# Ingest manifest: one small json entry per input file recording
+#   input, output, size, mtime, checksum -- to spot inputs that changed
+#   options                              -- filters/format the output was made with
+#   status                               -- running, done or failed
+#   lines, kept, out_bytes               -- progress at the last checkpoint
+#
+# While a file is running, lines is how far into the input the serialized
+# output has got and out_bytes how much of the (tmp) output holds those
+# records, so an interrupted ingest can cut the output back to out_bytes
+# and carry on from that line.  Entries are rewritten atomically, and each
+# input has its own entry file so parallel workers never share one.
+#
+
+import hashlib
+import json
+import os
+
+def file_checksum (input_file):
+    digest = hashlib.sha1()
+    infile = open(input_file, 'rb')
+    while True:
+        block = infile.read(1024*1024)
+        if (not block):
+            break
+        digest.update(block)
+    infile.close()
+    return digest.hexdigest()
+
+def input_state (input_file, entry=None):
+    # size, mtime and checksum of an input; the checksum from entry is
+    # reused when size and mtime have not changed, else it is None and left
+    # to the worker (Checkpoint.verify_input), so nothing is read in full here
+    st = os.stat(input_file)
+    state = {'size': st.st_size, 'mtime': st.st_mtime, 'checksum': None}
+    if (entry != None) and (entry.get('size')==st.st_size) and (entry.get('mtime')==st.st_mtime):
+        state['checksum'] = entry.get('checksum')
+    return state
+
+class Manifest (object):
+
+    def __init__ (self, manifest_dir):
+        self.manifest_dir = manifest_dir
+        if (not os.path.exists(manifest_dir)):
+            os.makedirs(manifest_dir)
+
+    def path (self, name):
+        return os.path.join(self.manifest_dir, name + '.json')
+
+    def get (self, name):
+        # Entry for name, None if there is none (or it is unreadable)
+        fn = self.path(name)
+        if (not os.path.exists(fn)):
+            return None
+        try:
+            infile = open(fn, 'r')
+            entry = json.load(infile)
+            infile.close()
+        except ValueError:
+            return None
+        return entry
+
+    def put (self, name, entry):
+        fn = self.path(name)
+        tmp_fn = fn + '.tmp'
+        outfile = open(tmp_fn, 'w')
+        json.dump(entry, outfile, indent=1, sort_keys=True)
+        outfile.flush()
+        os.fsync(outfile.fileno())
+        outfile.close()
+        os.rename(tmp_fn, fn)
+
+class Checkpoint (object):
+    # Progress recorder for one input, handed to tweet_pipeline.ingest_file
+    # (picklable, so it can go to a pool worker with the rest of the job)
+    # previous_checksum is the checksum of a touched input's earlier run, whose
+    # output or progress is kept only if the content turns out unchanged
+
+    def __init__ (self, manifest, name, entry, previous_checksum=None):
+        self.manifest = manifest
+        self.name = name
+        self.entry = entry
+        self.previous_checksum = previous_checksum
+
+    def verify_input (self):
+        # Run in the worker: checksum the input if the entry has no checksum
+        # yet and start over if it differs from previous_checksum
+        # False if the entry is done and still good, so there is nothing to do
+        if (self.entry.get('checksum') == None):
+            checksum = file_checksum(self.entry['input'])
+            if (checksum != self.previous_checksum):
+                self.entry.update(status='running', lines=0, kept=0, out_bytes=0)
+            self.update(checksum=checksum)
+        return (self.entry.get('status') != 'done')
+
+    def resume_point (self):
+        # Entry to resume from, None to start from the beginning
+        if (self.entry.get('status')=='running') and (self.entry.get('out_bytes', 0) > 0):
+            return self.entry
+        return None
+
+    def update (self, **fields):
+        self.entry.update(fields)
+        self.manifest.put(self.name, self.entry)
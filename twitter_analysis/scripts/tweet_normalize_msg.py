@@ -13,31 +13,146 @@
 # BC, 3/30/13
 
 from optparse import OptionParser
+import collections
+import itertools
+import multiprocessing
 import pickle
 import re
 import tweet_tools as tt
 from get_counts import create_utf8_rewrite_hash
 from get_counts import normalize
-from get_counts import split
+from get_counts import normalize_joined
+from get_counts import isplit
+from get_counts import PROFILES
+from get_counts import RuleProfiler
+from get_counts import profile_rules
 
-def normalize_msgs (transactions, debug):
+def normalize_msg (msg, h, profile='full'):
+    # profile is a get_counts normalization profile
+    msgs_norm = []
+    for sent in isplit(msg):
+        msg_norm = normalize(sent, h, profile)
+        if (msg_norm == ''):
+            continue
+        msgs_norm.append(msg_norm)
+    return normalize_joined(u' '.join(msgs_norm), profile)
+
+class NormalizerCache (object):
+    # Bounded cache of message -> normalized message; retweets and spam repeat
+    # the same text many times.  hits/misses count lookups.  Use one cache
+    # per normalization profile.
+    # Approximate LRU in two generations of plain dicts (an OrderedDict is
+    # slow in python 2): new entries go in current; when that holds half of
+    # max_size it becomes previous and the old previous is dropped.  A hit in
+    # previous moves the entry back to current, so recently used messages stay.
+
+    def __init__ (self, max_size=100000):
+        self.max_size = max_size
+        self.current = {}
+        self.previous = {}
+        self.hits = 0
+        self.misses = 0
+
+    def __len__ (self):
+        return len(self.current) + len(self.previous)
+
+    def get (self, msg):
+        # Cached normalization of msg, None if not cached
+        msg_norm = self.current.get(msg)
+        if (msg_norm == None):
+            msg_norm = self.previous.get(msg)
+            if (msg_norm == None):
+                self.misses += 1
+                return None
+            self.put(msg, msg_norm)
+        self.hits += 1
+        return msg_norm
+
+    def put (self, msg, msg_norm):
+        if (self.max_size <= 0):
+            return
+        self.current[msg] = msg_norm
+        if (2*len(self.current) >= self.max_size):
+            self.previous = self.current
+            self.current = {}
+
+    def normalize (self, msg, h, profile='full'):
+        msg_norm = self.get(msg)
+        if (msg_norm == None):
+            msg_norm = normalize_msg(msg, h, profile)
+            self.put(msg, msg_norm)
+        return msg_norm
+
+    def hit_rate (self):
+        if (self.hits + self.misses == 0):
+            return 0.0
+        return float(self.hits) / (self.hits + self.misses)
+
+    def report (self):
+        return "normalizer cache: {} hits, {} misses, {:.1f}% hit rate".format(self.hits, self.misses, 100.0*self.hit_rate())
+
+def normalize_chunk (msgs, profile='full'):
+    # Pool worker side of normalize_batch
     h = create_utf8_rewrite_hash()
-    for key, value in transactions.items():
-        msg = value['msg']
-        msgs = split(msg)
-        if (debug > 0):
-            print u"msg: {}".format(msg)
-            # print u"msgs: {}".format(msgs)
-        msgs_norm = []
-        for sent in msgs:
-            msg_norm = normalize(sent, h)
-            if (msg_norm == ''):
-                continue
-            msgs_norm.append(msg_norm)
-        value['msg_norm'] = u' '.join(msgs_norm)
+    return [normalize_msg(msg, h, profile) for msg in msgs]
+
+def normalize_batch (msgs, workers=1, chunksize=1000, cache=None, profile='full'):
+    # Generator over the normalized messages of an iterable, in input order
+    # workers > 1 normalizes chunks of messages in a pool; at most 2*workers
+    # chunks are in flight, so msgs can be a stream
+    # cache (NormalizerCache), if given, is checked first; with a pool only
+    # the messages not already in it are sent to the workers
+    if (workers <= 1):
+        h = create_utf8_rewrite_hash()
+        if (cache == None):
+            for msg in msgs:
+                yield normalize_msg(msg, h, profile)
+        else:
+            for msg in msgs:
+                yield cache.normalize(msg, h, profile)
+        return
+    msgs = iter(msgs)
+    pool = multiprocessing.Pool(workers)
+    pending = collections.deque()
+    try:
+        while True:
+            while (len(pending) < 2*workers):
+                chunk = list(itertools.islice(msgs, chunksize))
+                if (len(chunk) == 0):
+                    break
+                if (cache == None):
+                    cached = [None]*len(chunk)
+                else:
+                    cached = [cache.get(msg) for msg in chunk]
+                todo = [msg for (msg, msg_norm) in itertools.izip(chunk, cached) if (msg_norm == None)]
+                pending.append((chunk, cached, pool.apply_async(normalize_chunk, (todo, profile))))
+            if (len(pending) == 0):
+                break
+            (chunk, cached, result) = pending.popleft()
+            done = iter(result.get())
+            for (msg, msg_norm) in itertools.izip(chunk, cached):
+                if (msg_norm == None):
+                    msg_norm = next(done)
+                    if (cache != None):
+                        cache.put(msg, msg_norm)
+                yield msg_norm
+    finally:
+        pool.terminate()
+        pool.join()
+
+def normalize_msgs (transactions, debug, workers=1, cache_size=100000, profile='full'):
+    # Messages repeated within cache_size distinct messages are normalized once
+    cache = NormalizerCache(cache_size)
+    keys = transactions.keys()
+    msgs = (transactions[key]['msg'] for key in keys)
+    for (key, msg_norm) in itertools.izip(keys, normalize_batch(msgs, workers, cache=cache, profile=profile)):
+        value = transactions[key]
+        value['msg_norm'] = msg_norm
         if (debug > 0):
+            print u"msg: {}".format(value['msg'])
             print u"normalized msg: {}".format(value['msg_norm'])
             print
+    print cache.report()
 
 # Main driver: command line interface
 if __name__ == '__main__':
@@ -47,10 +162,16 @@ if __name__ == '__main__':
     parser.add_option("--input_file", help="input pickled file of tweets", metavar="FILE")
     parser.add_option("--output_file", help="output pickled file of tweets", metavar="FILE")
     parser.add_option("--verbose", help="verbosity > 0 -> debug mode", metavar="FILE", default=0)
+    parser.add_option("--workers", help="number of processes to normalize with", default=1)
+    parser.add_option("--profile", help="normalization profile: " + ", ".join(sorted(PROFILES)), default='full', choices=sorted(PROFILES))
+    parser.add_option("--cache_size", help="distinct messages kept in the normalizer cache, 0 for none", default=100000)
+    parser.add_option("--rule_report", help="time and count every normalization rule, report written to FILE", metavar="FILE")
     (Options, args) = parser.parse_args()
     input_file = Options.input_file
     output_file = Options.output_file
     debug = int(Options.verbose)
+    workers = int(Options.workers)
+    cache_size = int(Options.cache_size)
     if (input_file==None or output_file==None):
         print "Need to specify input and output files -- run with --help for syntax"
         exit(1)
@@ -59,7 +180,21 @@ if __name__ == '__main__':
     transactions = tt.load_tweets(input_file)
     print 'Done'
 
-    normalize_msgs(transactions, debug)
+    profiler = None
+    if (Options.rule_report != None):
+        # The instrumented rules only record in this process
+        profiler = RuleProfiler()
+        profile_rules(profiler)
+        workers = 1
+
+    normalize_msgs(transactions, debug, workers, cache_size, Options.profile)
+
+    if (profiler != None):
+        profile_rules(None)
+        report_file = open(Options.rule_report, 'w')
+        report_file.write(profiler.report() + '\n')
+        report_file.close()
+        print 'Rule report written to: {}'.format(Options.rule_report)
 
     outfile = open(output_file, 'w')
     pickle.dump(transactions, outfile)
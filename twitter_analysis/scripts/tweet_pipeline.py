@@ -0,0 +1,191 @@
+#!/usr/bin/env python
+#
+# Copyright (c) 2015
+# Massachusetts Institute of Technology
+#
+# All Rights Reserved
+#
+
+#
+# Streaming ingest: raw tsv -> filter -> metadata -> normalize -> (lid) -> serialize
+# Each stage is a generator, so only one transaction is in flight at a time
+# and memory does not grow with the size of the input file
+#
+
+import argparse
+import collections
+import itertools
+import os
+import sys
+import traceback
+import tweet_tools as tt
+import tweet_to_dict as ttd
+import tweet_regions as tr
+import tweet_simple_metadata as tsm
+import tweet_normalize_msg as tnm
+import tweet_strtab as tst
+
+def metadata_stage (xacts, debug):
+    for xact in xacts:
+        tsm.extract_simple_metadata(xact, debug)
+        yield xact
+
+def strtab_stage (xacts, table):
+    # Ids of the lower-cased user, mention and hashtag names (tweet_strtab.py)
+    for xact in xacts:
+        table.intern_tweet(xact)
+        yield xact
+
+def normalize_stage (xacts, debug, workers=1, cache=None):
+    # workers > 1 normalizes in a pool (tweet_normalize_msg.normalize_batch);
+    # the transactions waiting on their messages are held in order meanwhile
+    pending = collections.deque()
+    def msgs ():
+        for xact in xacts:
+            pending.append(xact)
+            yield xact['msg']
+    for msg_norm in tnm.normalize_batch(msgs(), workers, cache=cache):
+        xact = pending.popleft()
+        xact['msg_norm'] = msg_norm
+        if (debug > 0):
+            print u"normalized msg: {}".format(xact['msg_norm'])
+        yield xact
+
+def lid_stage (xacts, debug, batch_size=256):
+    # Language id batch_size transactions at a time (tweet_lid.lid_batch)
+    import tweet_lid as tlid  # pulls in the langid model, only load if asked
+    while True:
+        block = list(itertools.islice(xacts, batch_size))
+        if (len(block) == 0):
+            break
+        for (xact, lang) in zip(block, tlid.lid_batch([xact['msg_norm'] for xact in block])):
+            xact['lid_lui'] = lang
+            if (debug > 0):
+                print "predicted language lui: {}".format(xact['lid_lui'])
+            yield xact
+
+def mark_lines (xacts, stats, marks):
+    # Note the input line count as each transaction leaves the reader
+    for xact in xacts:
+        marks.append(stats['lines'])
+        yield xact
+
+def written_lines (xacts, marks, progress):
+    # Last stage before the writer: progress['lines'] is the input line of the
+    # transaction being written, however many are still in flight upstream
+    for xact in xacts:
+        progress['lines'] = marks.popleft()
+        yield xact
+
+def ingest_file (input_file, output_file, tgt_lang=None, bounding_box=None, do_lid=False, debug=0, workers=1, format='pickle', regions=None, checkpoint=None, norm_workers=1, strtab=False):
+    # Run the full ingest for one raw tweet file; returns line/kept counts
+    # workers > 1 parses blocks of the file in a pool and norm_workers > 1
+    # normalizes in a pool (neither from inside a pool worker)
+    # checkpoint (tweet_manifest.Checkpoint) records progress of a pickle
+    # stream as it is written, and a run it says was interrupted is resumed
+    # by appending to output_file after the lines already done
+    # strtab adds the interned name ids and saves their table next to output_file
+    resume = None
+    if (checkpoint != None) and (format == 'pickle'):
+        resume = checkpoint.resume_point()
+    stats = {}
+    if (resume != None):
+        infile = ttd.open_tweet_file(input_file)
+        xacts = ttd.read_tweets(infile, tgt_lang, bounding_box, stats, regions, resume['lines'])
+    elif (workers > 1):
+        # Lines are counted a block ahead of the output here, so no checkpoints
+        checkpoint = None
+        infile = ttd.open_raw_tweet_file(input_file)
+        xacts = ttd.read_tweets_parallel(infile, tgt_lang, bounding_box, stats, workers, regions=regions)
+    else:
+        infile = ttd.open_tweet_file(input_file)
+        xacts = ttd.read_tweets(infile, tgt_lang, bounding_box, stats, regions)
+    if (debug > 0):
+        xacts = itertools.islice(xacts, 100)
+    marks = collections.deque()
+    progress = {}
+    if (checkpoint != None):
+        xacts = mark_lines(xacts, stats, marks)
+    xacts = metadata_stage(xacts, debug)
+    table = None
+    if (strtab):
+        table = tst.StringTable()
+        if (resume != None):
+            # Ids go by first appearance, so interning the records already
+            # written again rebuilds the table as it was
+            for xact in tt.read_stream_until(output_file, resume['out_bytes']):
+                table.intern_tweet(xact)
+        xacts = strtab_stage(xacts, table)
+    cache = tnm.NormalizerCache()
+    xacts = normalize_stage(xacts, debug, norm_workers, cache)
+    if (do_lid):
+        xacts = lid_stage(xacts, debug)
+    if (checkpoint != None):
+        xacts = written_lines(xacts, marks, progress)
+    base_kept = 0
+    resume_at = None
+    if (resume != None):
+        base_kept = resume['kept']
+        resume_at = resume['out_bytes']
+    on_checkpoint = None
+    if (checkpoint != None) and (format == 'pickle'):
+        def on_checkpoint (out_bytes, count):
+            # The stream has just written the record for the line read last
+            checkpoint.update(status='running', lines=progress['lines'], kept=base_kept+count, out_bytes=out_bytes)
+    tt.save_tweets_stream(xacts, output_file, format, resume_at, on_checkpoint)
+    infile.close()
+    if (table != None):
+        table.save(tst.strtab_file(output_file))
+    stats['kept'] += base_kept
+    stats['norm_cache_hits'] = cache.hits
+    stats['norm_cache_misses'] = cache.misses
+    return stats
+
+def ingest_job (job):
+    # Pool entry point: job is the argument tuple for ingest_file
+    # Errors are returned rather than raised so one bad input does not stop the pool
+    # With a checkpoint the input is checksummed here, in the worker, when the
+    # manifest does not have its checksum yet; stats is None if the output of
+    # an earlier run is still good, else it carries the checksum
+    try:
+        checkpoint = job[9]
+        if (checkpoint != None) and (not checkpoint.verify_input()):
+            return (None, None)
+        stats = ingest_file(*job)
+        if (checkpoint != None):
+            stats['checksum'] = checkpoint.entry['checksum']
+        return (stats, None)
+    except Exception:
+        if (os.path.exists(job[1])):
+            os.unlink(job[1])
+        return (None, ''.join(traceback.format_exception(*sys.exc_info())))
+
+# Main driver: command line interface
+if __name__ == '__main__':
+
+    # Parse input command line options
+    parser = argparse.ArgumentParser(description="Streaming conversion of a TSV file to a serialized tweet file with metadata.")
+    parser.add_argument("--input_file", help="input file of tweets", type=str, required=True)
+    parser.add_argument("--output_file", help="output serialized file",  type=str, required=True)
+    parser.add_argument("--lang", help="ISO 639-1 code for target language",  type=str, required=False)
+    parser.add_argument("--bounding_box", help="southwest_lat,southwest_long,northeast_lat,northeast_long no spaces", type=str, required=False)
+    parser.add_argument("--regions", help="file of region boxes/polygons, keep and tag tweets inside any region", type=str, required=False)
+    parser.add_argument("--lid", help="add langid.py language id", action='store_true', default=False)
+    parser.add_argument("--verbose", help="verbosity > 0 -> debug mode", type=int, default=0)
+    parser.add_argument("--workers", help="parse blocks of the input file in parallel", type=int, default=1)
+    parser.add_argument("--norm_workers", help="normalize messages in parallel", type=int, default=1)
+    parser.add_argument("--format", help="serialized output format", type=str, default='pickle', choices=tt.FORMATS)
+    parser.add_argument("--strtab", help="add interned user/hashtag ids, table saved as <output_file>.strtab", action='store_true', default=False)
+    args = parser.parse_args()
+
+    bounding_box = None
+    if (args.bounding_box):
+        bounding_box = tuple([float(x) for x in args.bounding_box.split(",")])
+    regions = None
+    if (args.regions):
+        regions = tr.load_regions(args.regions)
+
+    print 'Reading in file: {}'.format(args.input_file)
+    stats = ingest_file(args.input_file, args.output_file, args.lang, bounding_box, args.lid, args.verbose, args.workers, args.format, regions, norm_workers=args.norm_workers, strtab=args.strtab)
+    print "Kept {} of {} lines".format(stats['kept'], stats['lines'])
+    print "Normalizer cache hits: {} of {} messages".format(stats['norm_cache_hits'], stats['norm_cache_hits'] + stats['norm_cache_misses'])
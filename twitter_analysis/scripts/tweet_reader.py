@@ -0,0 +1,177 @@
+#!/usr/bin/env python
+#
+# Copyright (c) 2015
+# Massachusetts Institute of Technology
+#
+# All Rights Reserved
+#
+
+#
+# Fast reading of (gzipped) utf-8 text files
+#
+# The codecs reader decodes and splits one line at a time on top of a
+# gzip file object, which runs well below raw decompression speed.  Here
+# the decompression runs ahead in a helper thread (or, on request, an
+# external pigz/gzip process) and the reader takes large byte blocks, cuts
+# them at the last newline and decodes and splits each block in one go.
+#
+# Lines are split with unicode splitlines, the same rule the codecs reader
+# uses, so u2028, x85 and friends end a line exactly as before.
+#
+
+import gzip
+import os
+import Queue
+import subprocess
+import threading
+
+BLOCK_BYTES = 1024*1024
+QUEUE_BLOCKS = 8
+
+def find_decompressor ():
+    # pigz if installed, else gzip; None if neither is on the path
+    for tool in ('pigz', 'gzip'):
+        for d in os.environ.get('PATH', '').split(os.pathsep):
+            path = os.path.join(d, tool)
+            if (os.path.isfile(path) and os.access(path, os.X_OK)):
+                return path
+    return None
+
+class BlockReader (object):
+    # Binary file-like reader (read, close) over the decompressed bytes of a
+    # file, filled by a helper thread a few blocks ahead of the consumer
+    # compressed=None goes by the .gz extension
+    # external=True decompresses in a separate pigz/gzip process (if one is on
+    # the path); the helper thread is the default, as the pipe measured slower
+    # (tweet_benchmark.py --bench read)
+
+    def __init__ (self, input_file, block_bytes=BLOCK_BYTES, external=False, compressed=None):
+        self.input_file = input_file
+        self.block_bytes = block_bytes
+        self.proc = None
+        if (compressed == None):
+            compressed = (input_file.split('.')[-1]=='gz')
+        if (compressed):
+            tool = None
+            if (external):
+                tool = find_decompressor()
+            if (tool != None):
+                self.proc = subprocess.Popen([tool, '-dc', input_file], stdout=subprocess.PIPE, bufsize=-1)
+                self.source = self.proc.stdout
+            else:
+                self.source = gzip.open(input_file, 'rb')
+        else:
+            self.source = open(input_file, 'rb')
+        self.queue = Queue.Queue(QUEUE_BLOCKS)
+        self.stopped = False
+        self.done = False
+        self.buf = ''
+        self.thread = threading.Thread(target=self._fill)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def _fill (self):
+        # Helper thread: push blocks, then None at the end (or the exception)
+        try:
+            while (not self.stopped):
+                block = self.source.read(self.block_bytes)
+                if (not block):
+                    break
+                self.queue.put(block)
+            if (self.proc != None) and (not self.stopped) and (self.proc.wait() != 0):
+                raise IOError('tweet_reader: decompression of {} failed'.format(self.input_file))
+            self.queue.put(None)
+        except Exception as e:
+            self.queue.put(e)
+
+    def next_block (self):
+        # Next decompressed block as produced, '' at the end of the file
+        if (self.buf):
+            block = self.buf
+            self.buf = ''
+            return block
+        if (self.done):
+            return ''
+        block = self.queue.get()
+        if (block is None):
+            self.done = True
+            return ''
+        if isinstance(block, Exception):
+            self.done = True
+            raise block
+        return block
+
+    def read (self, size=-1):
+        if (size < 0):
+            out = []
+            while True:
+                block = self.next_block()
+                if (not block):
+                    return ''.join(out)
+                out.append(block)
+        # Like a file: size bytes, fewer only at the end of the file
+        out = []
+        have = 0
+        while (have < size):
+            block = self.next_block()
+            if (not block):
+                break
+            if (have + len(block) > size):
+                self.buf = block[size-have:]
+                block = block[:size-have]
+            out.append(block)
+            have += len(block)
+        return ''.join(out)
+
+    def close (self):
+        self.stopped = True
+        if (self.proc != None) and (self.proc.poll() == None):
+            self.proc.kill()
+        # Unblock the helper if it is waiting on a full queue
+        while (self.thread.is_alive()):
+            try:
+                self.queue.get(True, 0.1)
+            except Queue.Empty:
+                pass
+        if (self.proc != None):
+            self.proc.wait()
+        self.source.close()
+
+def read_chunks (infile_raw, chunk_bytes):
+    # Split the decompressed byte stream into blocks that end on a line boundary
+    rest = ''
+    while True:
+        block = infile_raw.read(chunk_bytes)
+        if (not block):
+            break
+        block = rest + block
+        cut = block.rfind('\n')
+        if (cut < 0):
+            rest = block
+            continue
+        rest = block[cut+1:]
+        yield block[:cut+1]
+    if (rest):
+        yield rest
+
+class LineReader (object):
+    # Iterates over the unicode lines (with line ends) of a raw byte reader
+    # Drop-in for codecs.getreader('utf-8')(raw) when only iterated
+
+    def __init__ (self, raw, block_bytes=BLOCK_BYTES):
+        self.raw = raw
+        self.block_bytes = block_bytes
+
+    def __iter__ (self):
+        for chunk in read_chunks(self.raw, self.block_bytes):
+            for ln in chunk.decode('utf-8').splitlines(True):
+                yield ln
+
+    def close (self):
+        self.raw.close()
+
+def open_raw (input_file, block_bytes=BLOCK_BYTES, compressed=None, external=False):
+    return BlockReader(input_file, block_bytes, external, compressed)
+
+def open_lines (input_file, block_bytes=BLOCK_BYTES, compressed=None, external=False):
+    return LineReader(BlockReader(input_file, block_bytes, external, compressed), block_bytes)
@@ -0,0 +1,121 @@
+#!/usr/bin/env python
+#
+# Copyright (c) 2015
+# Massachusetts Institute of Technology
+#
+# All Rights Reserved
+#
+
+#
+# Compact tweet record
+#
+# A transaction used to be a dict with a string key per field; with tens of
+# millions of tweets the per-dict overhead dominates memory.  Tweet keeps
+# one slot per known field and still reads like the old dicts
+# (xact['msg'], xact.has_key('mentions'), xact.keys(), ...), so the
+# scripts work unchanged on records from old pickles and new ones.
+#
+
+FIELDS = ('id', 'date', 'userid', 'msg', 'geo', 'lid_gnip', 'regions', 'http_links', 'hashtags',
+          'mentions', 'retweet', 'user_msg', 'msg_norm', 'lid_lui', 'user_sid', 'mention_sids', 'hashtag_sids')
+_FIELD_SET = frozenset(FIELDS)
+
+def intern_str (s, strings):
+    # One shared copy of each repeated string value (user ids, language
+    # codes) among the records using the dict strings; the caller keeps it
+    # for one file or load, so it does not outlive the records.  Only for
+    # records held in memory together, not streamed ones
+    return strings.setdefault(s, s)
+
+class Tweet (object):
+    # Unset slots are missing fields; anything not in FIELDS goes in extra
+    __slots__ = FIELDS + ('extra',)
+
+    def __init__ (self, fields=None):
+        if (fields != None):
+            for (ky, val) in fields.iteritems():
+                self[ky] = val
+
+    def __getitem__ (self, ky):
+        if (ky in _FIELD_SET):
+            try:
+                return getattr(self, ky)
+            except AttributeError:
+                raise KeyError(ky)
+        try:
+            return self.extra[ky]
+        except AttributeError:
+            raise KeyError(ky)
+
+    def __setitem__ (self, ky, val):
+        if (ky in _FIELD_SET):
+            setattr(self, ky, val)
+            return
+        try:
+            self.extra[ky] = val
+        except AttributeError:
+            self.extra = {ky: val}
+
+    def __delitem__ (self, ky):
+        try:
+            if (ky in _FIELD_SET):
+                delattr(self, ky)
+            else:
+                del self.extra[ky]
+        except AttributeError:
+            raise KeyError(ky)
+
+    def has_key (self, ky):
+        if (ky in _FIELD_SET):
+            return hasattr(self, ky)
+        return hasattr(self, 'extra') and (ky in self.extra)
+
+    __contains__ = has_key
+
+    def get (self, ky, default=None):
+        try:
+            return self[ky]
+        except KeyError:
+            return default
+
+    def keys (self):
+        out = [ky for ky in FIELDS if hasattr(self, ky)]
+        if (hasattr(self, 'extra')):
+            out.extend(self.extra.keys())
+        return out
+
+    def __iter__ (self):
+        return iter(self.keys())
+
+    def __len__ (self):
+        return len(self.keys())
+
+    def items (self):
+        return [(ky, self[ky]) for ky in self.keys()]
+
+    def iteritems (self):
+        return iter(self.items())
+
+    def to_dict (self):
+        return dict(self.items())
+
+    def __eq__ (self, other):
+        if isinstance(other, Tweet):
+            other = other.to_dict()
+        return (self.to_dict() == other)
+
+    def __ne__ (self, other):
+        return not (self == other)
+
+    __hash__ = None
+
+    def __repr__ (self):
+        return 'Tweet({!r})'.format(self.to_dict())
+
+    # Pickle as a plain field dict
+    def __getstate__ (self):
+        return self.to_dict()
+
+    def __setstate__ (self, state):
+        for (ky, val) in state.iteritems():
+            self[ky] = val
@@ -0,0 +1,139 @@
+#!/usr/bin/env python
+#
+# Copyright (c) 2015
+# Massachusetts Institute of Technology
+#
+# All Rights Reserved
+#
+
+#
+# Geo regions (boxes and polygons) with a grid index for tagging tweets
+#
+# Regions file: one region per line, tab separated, # for comments
+#   region_id <tab> box <tab> southwest_lat,southwest_long,northeast_lat,northeast_long
+#   region_id <tab> polygon <tab> lat,long lat,long lat,long ...
+#
+# Each region is entered in the grid cells its bounding box overlaps, so a
+# lookup only tests the few regions registered in the tweet's cell rather
+# than every region in the file
+#
+
+import argparse
+import math
+
+class Region (object):
+    __slots__ = ('rid', 'order', 'box', 'polygon')
+
+    def __init__ (self, rid, order, box, polygon=None):
+        self.rid = rid
+        self.order = order
+        self.box = box
+        self.polygon = polygon
+
+    def contains (self, lat, lon):
+        box = self.box
+        if (lat<box[0] or lat>box[2] or lon<box[1] or lon>box[3]):
+            return False
+        if (self.polygon == None):
+            return True
+        return in_polygon(lat, lon, self.polygon)
+
+def in_polygon (lat, lon, polygon):
+    # Ray casting; polygon is a list of (lat, long) vertices, closed implicitly
+    inside = False
+    j = len(polygon) - 1
+    for i in xrange(len(polygon)):
+        (lat_i, lon_i) = polygon[i]
+        (lat_j, lon_j) = polygon[j]
+        if ((lat_i > lat) != (lat_j > lat)):
+            cross = lon_i + (lat - lat_i) * (lon_j - lon_i) / (lat_j - lat_i)
+            if (lon < cross):
+                inside = not inside
+        j = i
+    return inside
+
+class RegionIndex (object):
+    # Uniform lat/long grid; cells maps (row, col) -> list of regions
+    # Regions spanning more than max_cells cells are kept in a short list that
+    # is tested for every point instead of being copied into all those cells
+
+    def __init__ (self, regions, cell_deg=None, max_cells=10000):
+        self.regions = regions
+        if (cell_deg == None):
+            cell_deg = default_cell_size(regions)
+        self.cell_deg = cell_deg
+        self.cells = {}
+        self.wide = []
+        for region in regions:
+            (r0, c0) = self.cell(region.box[0], region.box[1])
+            (r1, c1) = self.cell(region.box[2], region.box[3])
+            if ((r1-r0+1)*(c1-c0+1) > max_cells):
+                self.wide.append(region)
+                continue
+            for r in xrange(r0, r1+1):
+                for c in xrange(c0, c1+1):
+                    self.cells.setdefault((r, c), []).append(region)
+
+    def __len__ (self):
+        return len(self.regions)
+
+    def cell (self, lat, lon):
+        return (int(math.floor(lat/self.cell_deg)), int(math.floor(lon/self.cell_deg)))
+
+    def lookup (self, geo):
+        # Ids of all regions containing geo=(lat, long), in regions file order
+        (lat, lon) = geo
+        found = [region for region in self.cells.get(self.cell(lat, lon), ()) if region.contains(lat, lon)]
+        if (self.wide):
+            found.extend([region for region in self.wide if region.contains(lat, lon)])
+            found.sort(key=lambda region: region.order)
+        return [region.rid for region in found]
+
+def default_cell_size (regions):
+    # About the size of a typical region, so most regions land in a handful of cells
+    if (len(regions) == 0):
+        return 1.0
+    sizes = sorted([max(r.box[2]-r.box[0], r.box[3]-r.box[1]) for r in regions])
+    return min(max(sizes[len(sizes)/2], 0.01), 10.0)
+
+def parse_region (rid, order, shape, coords):
+    if (shape == 'box'):
+        box = tuple([float(x) for x in coords.split(',')])
+        if (len(box) != 4):
+            raise ValueError('tweet_regions: box needs 4 values for region {}'.format(rid))
+        return Region(rid, order, box)
+    if (shape == 'polygon'):
+        polygon = [tuple([float(x) for x in pt.split(',')]) for pt in coords.split()]
+        if (len(polygon) < 3):
+            raise ValueError('tweet_regions: polygon needs at least 3 points for region {}'.format(rid))
+        lats = [pt[0] for pt in polygon]
+        lons = [pt[1] for pt in polygon]
+        return Region(rid, order, (min(lats), min(lons), max(lats), max(lons)), polygon)
+    raise ValueError('tweet_regions: unknown shape {} for region {}'.format(shape, rid))
+
+def load_regions (regions_file, cell_deg=None):
+    regions = []
+    infile = open(regions_file, 'r')
+    for ln in infile:
+        ln = ln.strip()
+        if (ln=='' or ln.startswith('#')):
+            continue
+        f = ln.split('\t')
+        if (len(f) != 3):
+            raise ValueError('tweet_regions: expected id, shape and coordinates: {}'.format(ln))
+        regions.append(parse_region(f[0].decode('utf-8'), len(regions), f[1], f[2]))
+    infile.close()
+    return RegionIndex(regions, cell_deg)
+
+# Main driver: command line interface
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description="Look up the regions containing a point.")
+    parser.add_argument("--regions", help="regions file", type=str, required=True)
+    parser.add_argument("--point", help="lat,long no spaces", type=str, required=True)
+    args = parser.parse_args()
+
+    index = load_regions(args.regions)
+    geo = tuple([float(x) for x in args.point.split(',')])
+    print 'Loaded {} regions, grid cell {} degrees'.format(len(index), index.cell_deg)
+    print 'Regions containing {}: {}'.format(geo, ', '.join(index.lookup(geo)))
@@ -15,61 +15,274 @@
 
 from optparse import OptionParser
 import cPickle as pickle
+import multiprocessing
+import numpy as np
 import re
 import tweet_tools as tt
 
-def add_simple_metadata (transactions, debug):
-    for key, value in transactions.items():
-        # msg = u' ' + value['msg'] + u' '
-        # msg_space = u' ' + tt.punctuation_to_space(value['msg']) + u' '
-        # msg_space = tt.punctuation_to_space(value['msg'])
-        msg = value['msg']
+# Single-pass entity scanner: each alternative consumes only its first
+# character and captures the entity with a lookahead, so the scan still
+# visits every character after it -- a hashtag or mention inside a link, or
+# a link inside a hashtag, is found just as the separate scans find it.
+# Every alternative starts with a literal, which lets re skip ahead to the
+# next h, #, @ or R instead of trying each alternative at every character.
+#   group 1: http link after its h, group 2: hashtag, group 3: mention, else "RT @"
+_entity_re = re.compile(u'h(?=(ttp:\/\/\S+))|\#(?=([a-zA-Z0-9_]+))|\@(?=([a-zA-Z0-9_]+))|R(?=T @)')
+_user_msg_re = re.compile(u'\s?@')
+
+def extract_simple_metadata (value, debug=0):
+    # Same fields as extract_simple_metadata_reference in one scan of the message
+    msg = value['msg']
+    if (debug > 0):
+        print u"msg: {}".format(msg)
+    links = []
+    hashtags = []
+    mentions = []
+    retweets = []
+    link_end = 0
+    for m in _entity_re.finditer(msg):
+        kind = m.lastindex
+        start = m.start()
+        if (kind == 1):
+            # Links do not overlap: one starting inside the last link is part of it
+            if (start >= link_end):
+                link_end = m.end(1)
+                links.append((start, msg[start:link_end]))
+        elif (kind == 2):
+            hashtags.append((start+1, m.group(2)))
+        elif (kind == 3):
+            mentions.append((start+1, m.group(3)))
+        else:
+            retweets.append(start)
+
+    if (len(links) > 0):
+        value['http_links'] = links
+        if (debug > 0):
+            print u"http links: {}".format(value['http_links'])
+    if (len(hashtags) > 0):
+        value['hashtags'] = hashtags
+        if (debug > 0):
+            print u"hashtags: {}".format(value['hashtags'])
+    if (len(mentions) > 0):
+        value['mentions'] = mentions
+        if (debug > 0):
+            print u"mentions: {}".format(value['mentions'])
+    if (len(retweets) > 0):
+        value['retweet'] = retweets
+        if (debug > 0):
+            print u"Retweets found: {} {}".format(len(retweets), retweets)
+    if (_user_msg_re.match(msg) != None):
+        value['user_msg'] = True
+        if (debug > 0):
+            print u"User-to-user message"
+
+    if (debug > 0):
+        print
+
+def extract_simple_metadata_reference (value, debug=0):
+    # Original version, one regex scan per field; kept to check and time
+    # extract_simple_metadata against (tweet_benchmark.py --bench metadata)
+    # msg = u' ' + value['msg'] + u' '
+    # msg_space = u' ' + tt.punctuation_to_space(value['msg']) + u' '
+    # msg_space = tt.punctuation_to_space(value['msg'])
+    msg = value['msg']
+    if (debug > 0):
+        print u"msg: {}".format(msg)
+        # print u"msg_space: {}".format(msg_space)
+
+    # http links
+    m = re.finditer('(http:\/\/\S+)', msg)
+    mval = [(k.start(), k.group()) for k in m]
+    if (len(mval) > 0):
+        value['http_links'] = mval
+        if (debug > 0):
+            print u"http links: {}".format(value['http_links'])
+
+    # hashtags
+    # m = re.finditer(u'(\#\S+)', msg_space)
+    m = re.finditer(u'(\#[a-zA-Z0-9_]+)', msg)
+    mval = [(k.start()+1, k.group()[1:]) for k in m] # Don't save the # with every hashtag
+    if (len(mval) > 0):
+        value['hashtags'] = mval
+        if (debug > 0):
+            print u"hashtags: {}".format(value['hashtags'])
+    
+    # find at-mentions
+    # m = re.finditer('(\@\S+)', msg_space)
+    m = re.finditer('(\@[a-zA-Z0-9_]+)', msg)
+    mval = [(k.start()+1, k.group()[1:]) for k in m] # Don't save the @ with every at-mention
+    if (len(mval) > 0):
+        value['mentions'] = mval
+        if (debug > 0):
+            print u"mentions: {}".format(value['mentions'])
+
+    # Retweet locations
+    m = [loc.start() for loc in re.finditer(u"RT @", msg)]
+    if (len(m) > 0):
+        value['retweet'] = m
         if (debug > 0):
-            print u"msg: {}".format(msg)
-            # print u"msg_space: {}".format(msg_space)
-
-        # http links
-        m = re.finditer('(http:\/\/\S+)', msg)
-        mval = [(k.start(), k.group()) for k in m]
-        if (len(mval) > 0):
-            value['http_links'] = mval
-            if (debug > 0):
-                print u"http links: {}".format(value['http_links'])
-
-        # hashtags
-        # m = re.finditer(u'(\#\S+)', msg_space)
-        m = re.finditer(u'(\#[a-zA-Z0-9_]+)', msg)
-        mval = [(k.start()+1, k.group()[1:]) for k in m] # Don't save the # with every hashtag
-        if (len(mval) > 0):
-            value['hashtags'] = mval
-            if (debug > 0):
-                print u"hashtags: {}".format(value['hashtags'])
-        
-        # find at-mentions
-        # m = re.finditer('(\@\S+)', msg_space)
-        m = re.finditer('(\@[a-zA-Z0-9_]+)', msg)
-        mval = [(k.start()+1, k.group()[1:]) for k in m] # Don't save the @ with every at-mention
-        if (len(mval) > 0):
-            value['mentions'] = mval
-            if (debug > 0):
-                print u"mentions: {}".format(value['mentions'])
-
-        # Retweet locations
-        m = [loc.start() for loc in re.finditer(u"RT @", msg)]
-        if (len(m) > 0):
-            value['retweet'] = m
-            if (debug > 0):
-                print u"Retweets found: {} {}".format(len(m), m)
-
-        # User message
-        m = re.search(u"^\s?@", msg)
-        if (m != None):
-            value['user_msg'] = True
-            if (debug > 0):
-                print u"User-to-user message"
+            print u"Retweets found: {} {}".format(len(m), m)
 
+    # User message
+    m = re.search(u"^\s?@", msg)
+    if (m != None):
+        value['user_msg'] = True
         if (debug > 0):
-            print
+            print u"User-to-user message"
+
+    if (debug > 0):
+        print
+
+# Batched extraction into entity columns laid out as in a columnar tweet
+# file (tweet_store.py).  For message i:
+#   pairs -- http_links, hashtags, mentions: entries j in offsets[i]:offsets[i+1],
+#            each at position pos[j] with utf-8 text str_data[str_offsets[j]:str_offsets[j+1]]
+#   ints  -- retweet: values[offsets[i]:offsets[i+1]]
+#   flag  -- user_msg: present[i]
+# The list is in _entity_re group order, retweet (no group) after the rest
+ENTITY_FIELDS = [
+    ('http_links', 'pairs'),
+    ('hashtags', 'pairs'),
+    ('mentions', 'pairs'),
+    ('retweet', 'ints'),
+    ('user_msg', 'flag'),
+]
+
+def _offsets (counts):
+    offsets = np.zeros((len(counts)+1,), dtype=np.int64)
+    np.cumsum(counts, out=offsets[1:])
+    return offsets
+
+class EntityColumns (object):
+    # Entities of a batch of messages; arrays maps each of ENTITY_FIELDS to
+    # its parts, e.g. arrays['hashtags']['pos']
+
+    def __init__ (self, num, arrays):
+        self.num = num
+        self.arrays = arrays
+
+    def __len__ (self):
+        return self.num
+
+    def get (self, i, name):
+        # Field of message i as extract_simple_metadata sets it, None if absent
+        arrays = self.arrays[name]
+        if (name == 'user_msg'):
+            if (arrays['present'][i]):
+                return True
+            return None
+        (a, b) = (arrays['offsets'][i], arrays['offsets'][i+1])
+        if (a == b):
+            return None
+        if (name == 'retweet'):
+            return [int(x) for x in arrays['values'][a:b]]
+        (pos, str_offsets, str_data) = (arrays['pos'], arrays['str_offsets'], arrays['str_data'])
+        return [(int(pos[j]), str_data[str_offsets[j]:str_offsets[j+1]].tostring().decode('utf-8')) for j in xrange(a, b)]
+
+    def apply (self, xacts):
+        # Set the entity fields on the transactions the messages came from, in order
+        for (i, value) in enumerate(xacts):
+            for (name, kind) in ENTITY_FIELDS:
+                val = self.get(i, name)
+                if (val != None):
+                    value[name] = val
+
+def extract_columns (msgs):
+    # EntityColumns for a list of messages from one scan of the messages
+    # joined by newlines.  No entity can span a newline, so every match lies
+    # in one message and its position there is its offset from that
+    # message's start.
+    num = len(msgs)
+    starts = _offsets(np.array([len(msg)+1 for msg in msgs], dtype=np.int64))
+    found = []
+    link_end = 0
+    text = u'\n'.join(msgs)
+    for m in _entity_re.finditer(text):
+        kind = m.lastindex
+        start = m.start()
+        if (kind == 1):
+            if (start < link_end):
+                continue
+            link_end = m.end(1)
+            val = text[start:link_end]
+        elif (kind == None):
+            kind = 4
+            val = None
+        else:
+            # Hashtags and mentions are stored without the # or @
+            val = m.group(kind)
+            start += 1
+        found.append((start, kind, val))
+
+    pos = np.array([f[0] for f in found], dtype=np.int64)
+    kinds = np.array([f[1] for f in found], dtype=np.int8)
+    vals = np.array([f[2] for f in found], dtype=object)
+    rows = np.searchsorted(starts, pos, 'right') - 1
+    pos = pos - starts[rows]
+    arrays = {}
+    for (k, (name, kind)) in enumerate(ENTITY_FIELDS):
+        if (kind == 'flag'):
+            continue
+        sel = (kinds == k+1)
+        arrays[name] = {'offsets': _offsets(np.bincount(rows[sel], minlength=num)[:num])}
+        if (kind == 'ints'):
+            arrays[name]['values'] = pos[sel].astype(np.int32)
+        else:
+            strs = [s.encode('utf-8') for s in vals[sel]]
+            arrays[name]['pos'] = pos[sel].astype(np.int32)
+            arrays[name]['str_offsets'] = _offsets(np.array([len(s) for s in strs], dtype=np.int64))
+            arrays[name]['str_data'] = np.fromstring(''.join(strs), dtype=np.uint8)
+    arrays['user_msg'] = {'present': np.array([_user_msg_re.match(msg) != None for msg in msgs], dtype=np.bool_)}
+    return EntityColumns(num, arrays)
+
+def _concat_offsets (parts):
+    # Offset arrays of consecutive batches as one, each rebased onto the end of the last
+    out = [parts[0]]
+    base = parts[0][-1]
+    for offsets in parts[1:]:
+        out.append(offsets[1:] + base)
+        base += offsets[-1]
+    return np.concatenate(out)
+
+def concat_columns (parts):
+    # One EntityColumns from those of consecutive batches (at least one)
+    subs = {'pairs': ['offsets', 'pos', 'str_offsets', 'str_data'], 'ints': ['offsets', 'values'], 'flag': ['present']}
+    arrays = {}
+    for (name, kind) in ENTITY_FIELDS:
+        arrays[name] = {}
+        for sub in subs[kind]:
+            arrs = [part.arrays[name][sub] for part in parts]
+            if (sub.endswith('offsets')):
+                arrays[name][sub] = _concat_offsets(arrs)
+            else:
+                arrays[name][sub] = np.concatenate(arrs)
+    return EntityColumns(sum([len(part) for part in parts]), arrays)
+
+def extract_batch (msgs, workers=1, chunksize=10000):
+    # EntityColumns for a list of messages, extracted chunksize messages at
+    # a time; workers > 1 extracts the chunks in a pool
+    msgs = list(msgs)
+    chunks = [msgs[i:i+chunksize] for i in xrange(0, len(msgs), chunksize)] or [[]]
+    if (workers <= 1):
+        parts = [extract_columns(chunk) for chunk in chunks]
+    else:
+        pool = multiprocessing.Pool(workers)
+        try:
+            parts = pool.map(extract_columns, chunks, 1)
+        finally:
+            pool.terminate()
+            pool.join()
+    return concat_columns(parts)
+
+def add_simple_metadata (transactions, debug, workers=1):
+    # workers > 1 goes through extract_batch; the fields come out the same
+    if (workers <= 1) or (debug > 0):
+        for key, value in transactions.items():
+            extract_simple_metadata(value, debug)
+        return
+    keys = transactions.keys()
+    columns = extract_batch([transactions[key]['msg'] for key in keys], workers)
+    columns.apply([transactions[key] for key in keys])
 
 
 # Main driver: command line interface
@@ -80,19 +293,21 @@ if __name__ == '__main__':
     parser.add_option("--input_file", help="input pickled file of tweets", metavar="FILE")
     parser.add_option("--output_file", help="output pickled file of tweets", metavar="FILE")
     parser.add_option("--verbose", help="verbosity > 0 -> debug mode", metavar="FILE", default=0)
+    parser.add_option("--workers", help="number of processes to extract metadata with", default=1)
     (Options, args) = parser.parse_args()
     input_file = Options.input_file
     output_file = Options.output_file
     debug = int(Options.verbose)
+    workers = int(Options.workers)
     if (input_file==None or output_file==None):
         print "Need to specify input and output files -- run with --help for syntax"
         exit(1)
 
     print 'Reading in file: {}'.format(input_file)
-    transactions = tt.load_tweets(infile)
+    transactions = tt.load_tweets(input_file)
     print 'Done'
 
-    add_simple_metadata(transactions, debug)
+    add_simple_metadata(transactions, debug, workers)
 
     outfile = open(output_file, 'w')
     pickle.dump(transactions, outfile)
@@ -0,0 +1,441 @@
+#!/usr/bin/env python
+#
+# Copyright (c) 2015
+# Massachusetts Institute of Technology
+#
+# All Rights Reserved
+#
+
+#
+# Columnar, memory-mapped serialized tweet file
+#
+# Layout: magic, header length, JSON header, then one aligned array per
+# column part.  Fixed-width fields (id, date, geo, ints, flags) are plain arrays;
+# string and list fields are offset-indexed, i.e. record i is
+# data[offsets[i]:offsets[i+1]].  A reader maps the file and only touches
+# the arrays of the fields it asks for.
+#
+
+import array
+import cPickle as pickle
+import json
+import numpy as np
+from tweet_record import Tweet
+
+MAGIC = 'TWCOL01\n'
+ALIGN = 8
+
+# (field, kind) -- fields not listed here, or values that do not fit their
+# kind, are pickled per record in the '_extra' column
+FIELDS = [
+    ('id', 'id'),
+    ('date', 'fixed'),
+    ('userid', 'str'),
+    ('msg', 'str'),
+    ('geo', 'geo'),
+    ('lid_gnip', 'str'),
+    ('http_links', 'pairs'),
+    ('hashtags', 'pairs'),
+    ('mentions', 'pairs'),
+    ('retweet', 'ints'),
+    ('user_msg', 'flag'),
+    ('msg_norm', 'str'),
+    ('lid_lui', 'str'),
+    ('user_sid', 'int'),
+    ('mention_sids', 'ints'),
+    ('hashtag_sids', 'ints'),
+]
+FIELD_KINDS = dict(FIELDS)
+
+def is_columnar (input_file):
+    infile = open(input_file, 'rb')
+    magic = infile.read(len(MAGIC))
+    infile.close()
+    return (magic == MAGIC)
+
+def _from_array (arr, dtype):
+    # array.array -> numpy without going element by element
+    if (len(arr) == 0):
+        return np.zeros((0,), dtype=dtype)
+    return np.frombuffer(arr, dtype=np.dtype(arr.typecode)).astype(dtype)
+
+def _to_utf8 (val):
+    # None if val can't be stored as a string column
+    if isinstance(val, unicode):
+        return val.encode('utf-8')
+    if isinstance(val, str):
+        try:
+            val.decode('ascii')
+        except UnicodeDecodeError:
+            return None
+        return val
+    return None
+
+class _StrBuilder (object):
+    # Growable offset-indexed byte strings
+    def __init__ (self):
+        self.offsets = array.array('l', [0])
+        self.data = bytearray()
+
+    def append (self, b):
+        self.data.extend(b)
+        self.offsets.append(len(self.data))
+
+    def arrays (self, prefix=''):
+        return {prefix + 'offsets': _from_array(self.offsets, np.int64),
+                prefix + 'data': np.frombuffer(bytes(self.data), dtype=np.uint8)}
+
+class _ColumnBuilder (object):
+
+    def __init__ (self, name, kind):
+        self.name = name
+        self.kind = kind
+        self.present = bytearray()
+        if (kind in ('id', 'int')):
+            self.values = array.array('l')
+        elif (kind == 'fixed'):
+            self.values = []
+        elif (kind == 'geo'):
+            self.values = array.array('d')
+        elif (kind in ('str', 'pickle')):
+            self.strs = _StrBuilder()
+        elif (kind == 'pairs'):
+            self.offsets = array.array('l', [0])
+            self.pos = array.array('i')
+            self.strs = _StrBuilder()
+        elif (kind == 'ints'):
+            self.offsets = array.array('l', [0])
+            self.values = array.array('i')
+
+    def append (self, val, has_val):
+        # Returns False if val doesn't fit this column, the caller then keeps it as extra
+        ok = has_val and self._fits(val)
+        self.present.append(1 if ok else 0)
+        kind = self.kind
+        if (kind == 'id'):
+            self.values.append(int(val) if ok else 0)
+        elif (kind == 'int'):
+            self.values.append(val if ok else 0)
+        elif (kind == 'fixed'):
+            self.values.append(_to_utf8(val) if ok else '')
+        elif (kind == 'geo'):
+            self.values.extend(val if ok else (0.0, 0.0))
+        elif (kind == 'str'):
+            self.strs.append(_to_utf8(val) if ok else '')
+        elif (kind == 'pickle'):
+            self.strs.append(pickle.dumps(val, pickle.HIGHEST_PROTOCOL) if ok else '')
+        elif (kind == 'pairs'):
+            if (ok):
+                for (pos, s) in val:
+                    self.pos.append(pos)
+                    self.strs.append(_to_utf8(s))
+            self.offsets.append(len(self.pos))
+        elif (kind == 'ints'):
+            if (ok):
+                self.values.extend(val)
+            self.offsets.append(len(self.values))
+        return (ok or not has_val)
+
+    def _fits (self, val):
+        kind = self.kind
+        if (kind == 'id'):
+            return (isinstance(val, basestring) and val.isdigit() and unicode(int(val)) == val and int(val) < 2**63)
+        if (kind == 'int'):
+            return (isinstance(val, int) and (0 <= val < 2**63))
+        if (kind in ('fixed', 'str')):
+            return (_to_utf8(val) != None)
+        if (kind == 'geo'):
+            return (isinstance(val, tuple) and len(val) == 2 and all([isinstance(x, float) for x in val]))
+        if (kind == 'pairs'):
+            return (isinstance(val, list) and all([isinstance(x, tuple) and len(x) == 2 and isinstance(x[0], int) and (0 <= x[0] < 2**31) and _to_utf8(x[1]) != None for x in val]))
+        if (kind == 'ints'):
+            return (isinstance(val, list) and all([isinstance(x, int) and (0 <= x < 2**31) for x in val]))
+        if (kind == 'flag'):
+            return (val is True)
+        return True
+
+    def arrays (self):
+        out = {'present': np.frombuffer(bytes(self.present), dtype=np.bool_)}
+        kind = self.kind
+        if (kind in ('id', 'int')):
+            out['values'] = _from_array(self.values, np.int64)
+        elif (kind == 'fixed'):
+            out['values'] = np.array(self.values, dtype=np.string_)
+        elif (kind == 'geo'):
+            out['values'] = _from_array(self.values, np.float64).reshape(-1, 2)
+        elif (kind in ('str', 'pickle')):
+            out.update(self.strs.arrays())
+        elif (kind == 'pairs'):
+            out['offsets'] = _from_array(self.offsets, np.int64)
+            out['pos'] = _from_array(self.pos, np.int32)
+            out.update(self.strs.arrays('str_'))
+        elif (kind == 'ints'):
+            out['offsets'] = _from_array(self.offsets, np.int64)
+            out['values'] = _from_array(self.values, np.int32)
+        return out
+
+class ColumnWriter (object):
+    # Accumulates transactions into compact column buffers; close() writes the file
+
+    def __init__ (self, output_file):
+        self.output_file = output_file
+        self.num = 0
+        self.columns = [_ColumnBuilder(name, kind) for (name, kind) in FIELDS]
+        self.extra = _ColumnBuilder('_extra', 'pickle')
+
+    def append (self, xact, key=None):
+        if (key == None):
+            key = xact['id']
+        # The id column holds the key; a reader sets xact['id'] from it
+        extra = {}
+        for col in self.columns:
+            if (col.name == 'id'):
+                if (not col.append(key, True)):
+                    extra['_key'] = key
+                if (xact.get('id', key) != key):
+                    extra['id'] = xact['id']
+                continue
+            has_val = (col.name in xact)
+            val = xact.get(col.name)
+            if (not col.append(val, has_val)):
+                extra[col.name] = val
+        for ky in xact:
+            if (ky not in FIELD_KINDS):
+                extra[ky] = xact[ky]
+        self.extra.append(extra, len(extra) > 0)
+        self.num += 1
+
+    def close (self):
+        parts = []
+        header = {'num': self.num, 'columns': []}
+        for col in self.columns + [self.extra]:
+            arrays = col.arrays()
+            desc = {'name': col.name, 'kind': col.kind, 'arrays': {}}
+            for sub in sorted(arrays):
+                parts.append((desc, sub, np.ascontiguousarray(arrays[sub])))
+            header['columns'].append(desc)
+
+        # Lay out the arrays after the header, each aligned
+        hdr_len = len(json.dumps(header)) + 128 * len(parts)
+        offset = _align(len(MAGIC) + 8 + hdr_len)
+        for (desc, sub, arr) in parts:
+            desc['arrays'][sub] = {'dtype': arr.dtype.str, 'shape': list(arr.shape), 'offset': offset}
+            offset = _align(offset + arr.nbytes)
+        hdr = json.dumps(header)
+        if (len(hdr) > hdr_len):
+            raise Exception('tweet_store: header larger than reserved space')
+        hdr = hdr + ' ' * (hdr_len - len(hdr))
+
+        outfile = open(self.output_file, 'wb')
+        outfile.write(MAGIC)
+        outfile.write(np.array([hdr_len], dtype='<u8').tostring())
+        outfile.write(hdr)
+        for (desc, sub, arr) in parts:
+            outfile.write('\0' * (desc['arrays'][sub]['offset'] - outfile.tell()))
+            outfile.write(arr.tostring())
+        outfile.close()
+
+def _align (offset):
+    return ((offset + ALIGN - 1) // ALIGN) * ALIGN
+
+class ColumnStore (object):
+    # Read-only, memory-mapped view of a columnar tweet file
+
+    def __init__ (self, input_file):
+        self.input_file = input_file
+        self.buf = np.memmap(input_file, dtype=np.uint8, mode='r')
+        if (self.buf[:len(MAGIC)].tostring() != MAGIC):
+            raise IOError('tweet_store: not a columnar tweet file: {}'.format(input_file))
+        hdr_len = int(self.buf[len(MAGIC):len(MAGIC)+8].view('<u8')[0])
+        start = len(MAGIC) + 8
+        header = json.loads(self.buf[start:start+hdr_len].tostring())
+        self.num = header['num']
+        self.columns = {}
+        for desc in header['columns']:
+            self.columns[desc['name']] = desc
+        self.cache = {}
+
+    def __len__ (self):
+        return self.num
+
+    def array (self, name, sub):
+        # A column part as a numpy array backed by the mapped file
+        ky = (name, sub)
+        if (ky not in self.cache):
+            desc = self.columns[name]['arrays'][sub]
+            dtype = np.dtype(str(desc['dtype']))
+            nbytes = dtype.itemsize * int(np.prod(desc['shape']))
+            arr = self.buf[desc['offset']:desc['offset']+nbytes].view(dtype).reshape(desc['shape'])
+            self.cache[ky] = arr
+        return self.cache[ky]
+
+    def fields (self):
+        return [name for (name, kind) in FIELDS if name in self.columns]
+
+    def key (self, i):
+        if (self.has(i, 'id')):
+            return unicode(self.array('id', 'values')[i])
+        return self.get(i, '_extra')['_key']
+
+    def keys (self):
+        return [self.key(i) for i in xrange(0, self.num)]
+
+    def field (self, name):
+        # All values of one field, None where a record doesn't have it
+        return [self.get(i, name) for i in xrange(0, self.num)]
+
+    def has (self, i, name):
+        if (name not in self.columns):
+            return False
+        return bool(self.array(name, 'present')[i])
+
+    def get (self, i, name):
+        # Decode a single field of record i; None if not present
+        if (not self.has(i, name)):
+            return None
+        kind = self.columns[name]['kind']
+        if (kind == 'id'):
+            return unicode(self.array(name, 'values')[i])
+        if (kind == 'int'):
+            return int(self.array(name, 'values')[i])
+        if (kind == 'fixed'):
+            return self.array(name, 'values')[i].decode('utf-8')
+        if (kind == 'geo'):
+            return tuple([float(x) for x in self.array(name, 'values')[i]])
+        if (kind == 'flag'):
+            return True
+        if (kind == 'str'):
+            return self._string(name, '', i).decode('utf-8')
+        if (kind == 'pickle'):
+            return pickle.loads(self._string(name, '', i))
+        offsets = self.array(name, 'offsets')
+        (a, b) = (offsets[i], offsets[i+1])
+        if (kind == 'ints'):
+            return [int(x) for x in self.array(name, 'values')[a:b]]
+        if (kind == 'pairs'):
+            pos = self.array(name, 'pos')
+            return [(int(pos[j]), self._string(name, 'str_', j).decode('utf-8')) for j in xrange(a, b)]
+        raise Exception('tweet_store: unknown column kind {}'.format(kind))
+
+    def _string (self, name, prefix, i):
+        offsets = self.array(name, prefix + 'offsets')
+        return self.array(name, prefix + 'data')[offsets[i]:offsets[i+1]].tostring()
+
+    def record (self, i, fields=None):
+        # Decode record i into a Tweet, optionally only the given fields
+        if (fields == None):
+            fields = [name for (name, kind) in FIELDS] + [None]
+        xact = Tweet()
+        for name in fields:
+            if (name == 'id'):
+                xact['id'] = self.key(i)
+            elif (self.has(i, name)):
+                xact[name] = self.get(i, name)
+        if (self.has(i, '_extra')):
+            extra = self.get(i, '_extra')
+            for ky in extra:
+                if (ky != '_key') and ((ky in fields) or (None in fields) or (ky not in FIELD_KINDS)):
+                    xact[ky] = extra[ky]
+        return xact
+
+    def lookup (self, i, name):
+        # (True, value) if record i has the field, from its column or the extra column
+        extra = {}
+        if (self.has(i, '_extra')):
+            extra = self.get(i, '_extra')
+        if (name == 'id'):
+            return (True, extra.get('id', self.key(i)))
+        if (self.has(i, name)):
+            return (True, self.get(i, name))
+        if (name in extra) and (name != '_key'):
+            return (True, extra[name])
+        return (False, None)
+
+    def extra_keys (self, i):
+        if (not self.has(i, '_extra')):
+            return []
+        return [ky for ky in self.get(i, '_extra') if ky not in FIELD_KINDS and ky != '_key']
+
+    def last_indices (self):
+        # Index of the last record for each distinct key (the one to_dict
+        # keeps), in file order
+        if (self.array('id', 'present').all()):
+            (ids, idx) = np.unique(self.array('id', 'values')[::-1], return_index=True)
+            return [int(i) for i in np.sort(self.num - 1 - idx)]
+        last = {}
+        for i in xrange(0, self.num):
+            last[self.key(i)] = i
+        return sorted(last.itervalues())
+
+    def view (self, i, fields=None):
+        return RecordView(self, i, fields)
+
+    def iteritems (self, fields=None):
+        for i in xrange(0, self.num):
+            yield (self.key(i), self.record(i, fields))
+
+    def to_dict (self):
+        return dict(self.iteritems())
+
+class RecordView (object):
+    # Read-only, dict-like access to one record of a ColumnStore.  A field is
+    # decoded the first time it is read; if fields is given, only those fields
+    # are visible, e.g. RecordView(store, i, ['userid', 'mentions'])
+    __slots__ = ('store', 'i', 'fields', 'values')
+
+    def __init__ (self, store, i, fields=None):
+        self.store = store
+        self.i = i
+        self.fields = fields
+        self.values = {}
+
+    def _lookup (self, name):
+        if (name not in self.values):
+            if (self.fields != None) and (name not in self.fields):
+                self.values[name] = (False, None)
+            else:
+                self.values[name] = self.store.lookup(self.i, name)
+        return self.values[name]
+
+    def __getitem__ (self, name):
+        (found, val) = self._lookup(name)
+        if (not found):
+            raise KeyError(name)
+        return val
+
+    def get (self, name, default=None):
+        (found, val) = self._lookup(name)
+        if (not found):
+            return default
+        return val
+
+    def has_key (self, name):
+        return self._lookup(name)[0]
+
+    def __contains__ (self, name):
+        return self._lookup(name)[0]
+
+    def keys (self):
+        if (self.fields != None):
+            names = self.fields
+        else:
+            names = [name for (name, kind) in FIELDS] + self.store.extra_keys(self.i)
+        return [name for name in names if self.has_key(name)]
+
+    def __iter__ (self):
+        return iter(self.keys())
+
+    def items (self):
+        return [(name, self[name]) for name in self.keys()]
+
+    def to_dict (self):
+        return dict(self.items())
+
+def save_columnar (transactions, output_file):
+    writer = ColumnWriter(output_file)
+    for (key, xact) in transactions.iteritems():
+        writer.append(xact, key)
+    writer.close()
+
+def load_columnar (input_file):
+    return ColumnStore(input_file).to_dict()
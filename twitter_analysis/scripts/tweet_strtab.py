@@ -0,0 +1,96 @@
+#!/usr/bin/env python
+#
+# Copyright (c) 2015
+# Massachusetts Institute of Technology
+#
+# All Rights Reserved
+#
+
+#
+# Interned string table: each distinct string gets an integer id, in order
+# of first appearance
+#
+# Ingest (--strtab) interns the lower-cased user and hashtag names of every
+# tweet -- the graph node names, @user and #tag -- and stores their ids in
+# the record, so later stages compare and count ints instead of redoing
+# '@' + name.lower() for every use:
+#   user_sid      -- id of '@' + userid
+#   mention_sids  -- ids of the mentions, in the order of mentions
+#   hashtag_sids  -- ids of the hashtags, in the order of hashtags
+# The table is saved next to the serialized tweets as <file>.strtab, one
+# utf-8 string per line, line i holding id i.  Ids are local to one file.
+#
+
+import os
+
+STRTAB_EXT = '.strtab'
+
+def user_key (name):
+    return u'@' + name.lower()
+
+def hashtag_key (tag):
+    return u'#' + tag.lower()
+
+class StringTable (object):
+
+    def __init__ (self, strings=None):
+        self.strings = []
+        self.ids = {}
+        if (strings != None):
+            for s in strings:
+                self.intern(s)
+
+    def __len__ (self):
+        return len(self.strings)
+
+    def __getitem__ (self, sid):
+        return self.strings[sid]
+
+    def get (self, s):
+        # Id of s, None if it is not in the table
+        return self.ids.get(s)
+
+    def intern (self, s):
+        sid = self.ids.get(s)
+        if (sid == None):
+            sid = len(self.strings)
+            self.ids[s] = sid
+            self.strings.append(s)
+        return sid
+
+    def intern_tweet (self, xact):
+        # Set user_sid, mention_sids and hashtag_sids on a transaction
+        if (xact.has_key('userid')):
+            xact['user_sid'] = self.intern(user_key(xact['userid']))
+        if (xact.has_key('mentions')):
+            xact['mention_sids'] = [self.intern(user_key(name)) for (pos, name) in xact['mentions']]
+        if (xact.has_key('hashtags')):
+            xact['hashtag_sids'] = [self.intern(hashtag_key(tag)) for (pos, tag) in xact['hashtags']]
+
+    def remap (self, other):
+        # List taking ids of other to ids here, interning what is missing
+        return [self.intern(s) for s in other.strings]
+
+    def save (self, output_file):
+        outfile = open(output_file, 'wb')
+        for s in self.strings:
+            outfile.write(s.encode('utf-8'))
+            outfile.write('\n')
+        outfile.close()
+
+def strtab_file (tweet_file):
+    return tweet_file + STRTAB_EXT
+
+def load_strtab (input_file):
+    # Split on newlines only: names may hold other unicode line breaks
+    infile = open(input_file, 'rb')
+    strings = infile.read().decode('utf-8').split(u'\n')
+    infile.close()
+    return StringTable(strings[:-1])
+
+def load_tweet_strtab (tweet_file):
+    # String table saved with a serialized tweet file, None if there is none
+    fn = strtab_file(tweet_file)
+    if (not os.path.exists(fn)):
+        return None
+    return load_strtab(fn)
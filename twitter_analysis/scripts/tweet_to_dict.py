@@ -13,11 +13,15 @@
 # BC: initial version, 3/26/13; BC: updates for gzip & language filtering, 12/10/14
 
 import argparse
-import gzip
+import collections
+import multiprocessing
 import os
 import cPickle as pickle
-import codecs
+import numpy as np
 import tweet_tools as tt
+import tweet_regions as tr
+import tweet_reader as trd
+from tweet_record import Tweet, intern_str
 
 def in_bounding_box (geo, bounding_box):
     in_box = False
@@ -25,26 +29,217 @@ def in_bounding_box (geo, bounding_box):
         in_box = True
     return in_box
 
-def get_fields (ln):
-    output = {}
+def get_fields (ln, strings=None):
+    # strings, if given, is the intern_str table for the file being read
     f = ln.split('\t')
     num_fields = len(f)
 
     if (num_fields < 6):
         # No tweet, not interesting
-        output = None 
-        return output
-    output['id'] = f[0]
-    output['date'] = f[1]
-    output['userid'] = f[4]
-    output['msg'] = f[5]
+        return None
+    output = Tweet()
+    output.id = f[0]
+    output.date = f[1]
+    output.userid = f[4]
+    output.msg = f[5]
 
     # Additional non-standard fields
-    output['geo'] = tuple([float(x) for x in f[3].strip('()').split(',')])
-    output['lid_gnip'] = f[2]
+    output.geo = tuple([float(x) for x in f[3].strip('()').split(',')])
+    output.lid_gnip = f[2]
+    if (strings != None):
+        output.userid = intern_str(output.userid, strings)
+        output.lid_gnip = intern_str(output.lid_gnip, strings)
 
     return output
 
+def keep_tweet (xact, tgt_lang, bounding_box):
+    # Language and geo filters -- either may be None to keep everything
+    if (tgt_lang!=None) and (xact['lid_gnip']!=tgt_lang):
+        return False
+    if (bounding_box!=None) and (not in_bounding_box(xact['geo'], bounding_box)):
+        return False
+    return True
+
+def tag_regions (xact, regions):
+    # Tag with the ids of the regions containing the tweet; tweets outside every region are dropped
+    ids = regions.lookup(xact['geo'])
+    if (len(ids) == 0):
+        return False
+    xact['regions'] = ids
+    return True
+
+def prefilter_line (ln, tgt_lang, bounding_box):
+    # Cheap language/geo check on the raw line before get_fields builds a record
+    # Lines that pass still go through keep_tweet; lines get_fields would
+    # drop (fewer than 6 fields) are dropped before their geo is parsed
+    if (tgt_lang!=None) and (u'\t' + tgt_lang + u'\t' not in ln):
+        return False
+    f = ln.rstrip().split('\t', 5)
+    if (len(f) < 6):
+        return False
+    if (tgt_lang!=None) and (f[2]!=tgt_lang):
+        return False
+    if (bounding_box!=None):
+        geo = tuple([float(x) for x in f[3].strip('()').split(',')])
+        return in_bounding_box(geo, bounding_box)
+    return True
+
+def prefilter_batch (lines, tgt_lang, bounding_box):
+    # prefilter_line over a batch of lines, with the bounding box test done on
+    # numpy arrays of lat/long; returns the lines that may be kept
+    cand = []
+    geos = []
+    for ln in lines:
+        if (tgt_lang!=None) and (u'\t' + tgt_lang + u'\t' not in ln):
+            continue
+        f = ln.rstrip().split('\t', 5)
+        if (len(f) < 6):
+            continue
+        if (tgt_lang!=None) and (f[2]!=tgt_lang):
+            continue
+        cand.append(ln)
+        geos.append(f[3].strip('()'))
+    if (bounding_box==None) or (len(cand)==0):
+        return cand
+    try:
+        latlon = np.array(u','.join(geos).split(u','), dtype=np.float64)
+    except ValueError:
+        latlon = None
+    if (latlon is None) or (len(latlon) != 2*len(cand)):
+        # Odd geo field somewhere, do it line by line
+        return [ln for ln in cand if prefilter_line(ln, None, bounding_box)]
+    lat = latlon[0::2]
+    lon = latlon[1::2]
+    mask = (lat>=bounding_box[0]) & (lat<=bounding_box[2]) & (lon>=bounding_box[1]) & (lon<=bounding_box[3])
+    return [cand[j] for j in np.flatnonzero(mask)]
+
+def open_raw_tweet_file (input_file):
+    # Decompressed bytes, read ahead in a helper thread/process
+    return trd.open_raw(input_file)
+
+def open_tweet_file (input_file):
+    # Unicode lines, decoded and split a block at a time
+    return trd.open_lines(input_file)
+
+def read_tweets (infile, tgt_lang=None, bounding_box=None, stats=None, regions=None, skip_lines=0, strings=None):
+    # Generator over the filtered transactions in an open tweet file
+    # stats, if given, is a dict updated in place with 'lines' and 'kept' counts
+    # The first skip_lines lines (already done by a resumed run) are counted but not parsed
+    # strings, if given, is an intern_str table repeated field values are
+    # shared through; only worth it when the records are all kept in memory,
+    # as the table holds every distinct value until the caller drops it
+    if (stats is None):
+        stats = {}
+    stats['lines'] = 0
+    stats['kept'] = 0
+    filtered = (tgt_lang!=None) or (bounding_box!=None)
+    for ln in infile:
+        if ((stats['lines'] % 100000)==0):
+            print "\ton line: {}".format(stats['lines'])
+        stats['lines'] += 1
+        if (stats['lines'] <= skip_lines):
+            continue
+        if (filtered) and (not prefilter_line(ln, tgt_lang, bounding_box)):
+            continue
+        ln = ln.rstrip()
+        xact = get_fields(ln, strings)
+        if (xact == None):
+            continue
+        if (not keep_tweet(xact, tgt_lang, bounding_box)):
+            continue
+        if (regions!=None) and (not tag_regions(xact, regions)):
+            continue
+        stats['kept'] += 1
+        yield xact
+
+# Text fields parse_chunk sends back, each as one column string joined with
+# tabs -- a field of a tab separated line cannot hold one
+CHUNK_FIELDS = ('id', 'date', 'userid', 'msg', 'lid_gnip')
+
+def parse_chunk (chunk, tgt_lang, bounding_box, regions=None):
+    # Worker side of read_tweets_parallel: decode, split and filter one block
+    # splitlines matches the line breaking of the codecs reader
+    # The kept records go back as columns, which pickle many times faster
+    # than Tweet objects: (lines, kept, CHUNK_FIELDS columns, lat/long pairs
+    # as a float array, region ids or None); see chunk_records
+    lines = chunk.decode('utf-8').splitlines()
+    num_lines = len(lines)
+    if (tgt_lang!=None) or (bounding_box!=None):
+        lines = prefilter_batch(lines, tgt_lang, bounding_box)
+    xacts = []
+    for ln in lines:
+        xact = get_fields(ln.rstrip())
+        if (xact == None):
+            continue
+        if (not keep_tweet(xact, tgt_lang, bounding_box)):
+            continue
+        if (regions!=None) and (not tag_regions(xact, regions)):
+            continue
+        xacts.append(xact)
+    columns = tuple([u'\t'.join([rec[ky] for rec in xacts]) for ky in CHUNK_FIELDS])
+    geos = [rec.geo for rec in xacts]
+    if (all([len(geo)==2 for geo in geos])):
+        geos = np.array(geos, dtype=np.float64).reshape(-1)
+    region_ids = None
+    if (regions!=None):
+        region_ids = [rec.regions for rec in xacts]
+    return (num_lines, len(xacts), columns, geos, region_ids)
+
+def chunk_records (num_kept, columns, geos, region_ids, strings=None):
+    # Parent side of parse_chunk: the Tweet records of one block
+    if (num_kept == 0):
+        return []
+    (ids, dates, userids, msgs, lids) = [col.split(u'\t') for col in columns]
+    if (isinstance(geos, np.ndarray)):
+        latlon = geos.tolist()
+        geos = [(latlon[2*j], latlon[2*j+1]) for j in xrange(0, num_kept)]
+    xacts = []
+    for j in xrange(0, num_kept):
+        xact = Tweet()
+        xact.id = ids[j]
+        xact.date = dates[j]
+        xact.userid = userids[j]
+        xact.msg = msgs[j]
+        xact.geo = geos[j]
+        xact.lid_gnip = lids[j]
+        if (strings != None):
+            xact.userid = intern_str(xact.userid, strings)
+            xact.lid_gnip = intern_str(xact.lid_gnip, strings)
+        if (region_ids != None):
+            xact.regions = region_ids[j]
+        xacts.append(xact)
+    return xacts
+
+def read_tweets_parallel (infile_raw, tgt_lang=None, bounding_box=None, stats=None, workers=2, chunk_bytes=4*1024*1024, regions=None, strings=None):
+    # Same output and order as read_tweets, but the parsing is spread over a pool
+    # The parent only decompresses; at most 2*workers blocks are in flight
+    # strings as for read_tweets
+    if (stats is None):
+        stats = {}
+    stats['lines'] = 0
+    stats['kept'] = 0
+    pool = multiprocessing.Pool(workers)
+    pending = collections.deque()
+    chunks = trd.read_chunks(infile_raw, chunk_bytes)
+    try:
+        while True:
+            while (len(pending) < 2*workers):
+                chunk = next(chunks, None)
+                if (chunk == None):
+                    break
+                pending.append(pool.apply_async(parse_chunk, (chunk, tgt_lang, bounding_box, regions)))
+            if (len(pending) == 0):
+                break
+            (num_lines, num_kept, columns, geos, region_ids) = pending.popleft().get()
+            print "\ton line: {}".format(stats['lines'])
+            stats['lines'] += num_lines
+            stats['kept'] += num_kept
+            for xact in chunk_records(num_kept, columns, geos, region_ids, strings):
+                yield xact
+    finally:
+        pool.terminate()
+        pool.join()
+
 # Main driver: command line interface
 if __name__ == '__main__':
 
@@ -55,6 +250,9 @@ if __name__ == '__main__':
     parser.add_argument("--lang", help="ISO 639-1 code for target language",  type=str, required=False)
     parser.add_argument("--verbose", help="verbosity > 0 -> debug mode", type=int, default=0)
     parser.add_argument("--bounding_box", help="southwest_lat,southwest_long,northeast_lat,northeast_long no spaces", type=str, required=False)
+    parser.add_argument("--regions", help="file of region boxes/polygons, keep and tag tweets inside any region", type=str, required=False)
+    parser.add_argument("--workers", help="parse blocks of the input file in parallel", type=int, default=1)
+    parser.add_argument("--chunk_bytes", help="size of the blocks given to each worker", type=int, default=4*1024*1024)
 
     args = parser.parse_args()
     input_file = args.input_file
@@ -64,43 +262,29 @@ if __name__ == '__main__':
     bounding_box = None
     if (args.bounding_box):
         bounding_box = tuple([float(x) for x in args.bounding_box.split(",")])
+    regions = None
+    if (args.regions):
+        regions = tr.load_regions(args.regions)
 
     print 'Reading in file: {}'.format(input_file)
     transactions = {}
-    if (input_file.split('.')[-1]=='gz'):
-        infile_raw = gzip.open(input_file, 'r')
+    stats = {}
+    # All records are kept until saved, so share their repeated strings
+    strings = {}
+    if (args.workers > 1):
+        infile = open_raw_tweet_file(input_file)
+        xacts = read_tweets_parallel(infile, tgt_lang, bounding_box, stats, args.workers, args.chunk_bytes, regions, strings)
     else:
-        infile_raw = open(input_file, 'r')
-    rdr = codecs.getreader('utf-8')
-    infile = rdr(infile_raw)
-    count = 0
-    success = 0
-    for ln in infile:
-        if ((count % 100000)==0):
-            print "\ton line: {}".format(count)
-        count += 1
-        ln = ln.rstrip()
-        xact = get_fields(ln)
-        if (xact == None):
-            continue
-        if ('lid_gnip' in xact) and (tgt_lang!=None) and (xact['lid_gnip']==tgt_lang):
-            if (bounding_box!=None) and ('geo' in xact) and (in_bounding_box(xact['geo'], bounding_box)):
-                success += 1
-                transactions[xact['id']] = xact
-            elif (bounding_box is None):
-                success += 1
-                transactions[xact['id']] = xact
-        elif (tgt_lang==None):
-            if (bounding_box) and ('geo' in xact) and (in_bounding_box(xact['geo'], bounding_box)):
-                success += 1
-                transactions[xact['id']] = xact
-            elif (bounding_box is None):
-                success += 1
-                transactions[xact['id']] = xact
-        if (debug>0 and success==100):
+        infile = open_tweet_file(input_file)
+        xacts = read_tweets(infile, tgt_lang, bounding_box, stats, regions, strings=strings)
+    num_kept = 0
+    for xact in xacts:
+        transactions[xact['id']] = xact
+        num_kept += 1
+        if (debug>0 and num_kept>=100):
             break
     infile.close()
 
     tt.save_tweets(transactions, output_file)
 
-    print "Percentage of tweets kept: {} %".format(100.0*((0.0 + success)/count))
+    print "Percentage of tweets kept: {} %".format(100.0*((0.0 + stats['kept'])/stats['lines']))
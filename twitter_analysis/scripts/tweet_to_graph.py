@@ -14,11 +14,11 @@
 
 import argparse
 import codecs
-import copy
 import glob
 import gzip
 import os
 import tweet_tools as tt 
+import tweet_strtab as tst
 import cPickle as pickle
 import networkx as nx
 import sys
@@ -38,8 +38,28 @@ else:
     print "Not counting retweets"
 
 tmpdir = 'tmp/'
+graph_fields = ['userid', 'mentions', 'retweet', 'user_msg', 'hashtags', 'user_sid', 'mention_sids', 'hashtag_sids']
 debug = 0  # set to 1 for more info and a smaller processing set
 
+# While building, graph nodes are ids in one string table of node names
+# (@user, #hashtag), relabeled to the names before the graph is saved;
+# files ingested with --strtab carry the ids of their own table, which are
+# mapped onto this one once per file, other files are interned tweet by tweet
+names = tst.StringTable()
+
+def user_node (val, remap):
+    if (remap != None) and (val.has_key('user_sid')):
+        return remap[val['user_sid']]
+    return names.intern(tst.user_key(val['userid']))
+
+def entity_list (val, field, sid_field, key_fn, remap):
+    # (position, name, node id) for each mention or hashtag of a tweet
+    if (not val.has_key(field)):
+        return []
+    if (remap != None) and (val.has_key(sid_field)):
+        return [(pos, name, remap[sid]) for ((pos, name), sid) in zip(val[field], val[sid_field])]
+    return [(pos, name, names.intern(key_fn(name))) for (pos, name) in val[field]]
+
 outfile_pckl = os.path.join(tmpdir, os.path.basename(listfn) + ".gpckl")
 if (os.path.exists(outfile_pckl)):
     print 'Graph {} already exists, exiting ...'.format(outfile_pckl)
@@ -54,25 +74,23 @@ for fn in listfile:
     print "Loading file: {}".format(fn)
     sys.stdout.flush()
 
-    # Load in tweets
+    # Add to graph -- only the fields used here are decoded
     fn = fn.rstrip()
-    xact = tt.load_tweets(fn)
-
-    # Add to graph
-    for ky in xact.keys():
-        val = xact[ky]
+    file_names = tst.load_tweet_strtab(fn)
+    remap = None
+    if (file_names != None):
+        remap = names.remap(file_names)
+    for (ky, val) in tt.iter_tweets(fn, graph_fields):
         
         # user node
-        user = '@' + val['userid'].lower()
+        user = user_node(val, remap)
         if (not G.has_node(user)):
             G.add_node(user)
             G.node[user]['type'] = 'user'
 
         # Mention list
-        if (val.has_key('mentions')):
-            mention_list = copy.deepcopy(val['mentions'])
-        else:
-            mention_list = []
+        mentions = entity_list(val, 'mentions', 'mention_sids', tst.user_key, remap)
+        mention_list = list(mentions)
 
         # Retweets
         if (val.has_key('retweet') and val.has_key('mentions')): 
@@ -87,7 +105,7 @@ for fn in listfile:
                         found = True
                         break
                 if (found):
-                    user2 = '@' + mention_list[j][1].lower()
+                    user2 = mention_list[j][2]
                     if (not G.has_node(user2)):
                         G.add_node(user2)
                         G.node[user2]['type'] = 'user'
@@ -114,7 +132,7 @@ for fn in listfile:
             next_expected_mention = 1  # offset by 1 
             while (mention_list[0][0]==next_expected_mention):
                 # assume first mention is recipient
-                user2 = '@' + mention_list[0][1].lower()
+                user2 = mention_list[0][2]
                 if (user==user2): # skip self-loops
                     next_expected_mention += len(mention_list[0][1])+2
                     mention_list = mention_list[1:] 
@@ -139,7 +157,7 @@ for fn in listfile:
         # Remaining mentions, co-occurrence
         if (len(mention_list) > 0):
             for mpair in mention_list:
-                mention = '@' + mpair[1].lower()
+                mention = mpair[2]
                 if (not G.has_node(mention)):
                     G.add_node(mention)
                     G.node[mention]['type'] = 'user'
@@ -147,8 +165,8 @@ for fn in listfile:
             # Mention co-occurrence
             for mp1 in mention_list:
                 for mp2 in mention_list:
-                    mp1_mention = '@' + mp1[1].lower()
-                    mp2_mention = '@' + mp2[1].lower()
+                    mp1_mention = mp1[2]
+                    mp2_mention = mp2[2]
                     if (mp1_mention==mp2_mention):  # skip self-loops
                         continue
                     if (not G.has_edge(mp1_mention, mp2_mention)):
@@ -165,17 +183,18 @@ for fn in listfile:
                     G[mp2_mention][mp1_mention]['count_coc'] += 1
 
         # Hashtag co-occurence
-        if (val.has_key('hashtags') and (len(val['hashtags'])>1)):
-            ht_list = val['hashtags']
+        hashtags = entity_list(val, 'hashtags', 'hashtag_sids', tst.hashtag_key, remap)
+        if (len(hashtags)>1):
+            ht_list = hashtags
             for ht in ht_list:
-                ht_val = u"#" + ht[1].lower()
+                ht_val = ht[2]
                 if (not G.has_node(ht_val)):
                     G.add_node(ht_val)
                     G.node[ht_val]['type'] = 'ht'
             for ht1 in ht_list:
                 for ht2 in ht_list:
-                    ht1_val = u"#" + ht1[1].lower()
-                    ht2_val = u"#" + ht2[1].lower()
+                    ht1_val = ht1[2]
+                    ht2_val = ht2[2]
                     if (ht1_val==ht2_val):
                         continue
                     if (not G.has_edge(ht1_val, ht2_val)):
@@ -189,10 +208,10 @@ for fn in listfile:
 
         # User -> Hashtag
         if (val.has_key('hashtags')):
-            ht_list = copy.deepcopy(val['hashtags'])
+            ht_list = hashtags
             # Main tweeter connects to all hashtags
             for ht in ht_list:
-                ht_val = u"#" + ht[1].lower()
+                ht_val = ht[2]
                 if (not G.has_node(ht_val)):
                     G.add_node(ht_val)
                     G.node[ht_val]['type'] = 'ht'
@@ -203,17 +222,17 @@ for fn in listfile:
             if (recount_retweets and val.has_key('retweet') and val.has_key('mentions')):
                 for index in val['retweet']:
                     found = False
-                    mention_list = val['mentions']
+                    mention_list = mentions
                     for j in xrange(0, len(mention_list)):
                         if (mention_list[j][0]==(index+4)):
                             found = True
                             break
                     if (found):
-                        user1 = '@' + mention_list[j][1].lower()
+                        user1 = mention_list[j][2]
                         for ht_pr in ht_list:
                             if (ht_pr[0] > index):
                                 # this user tweeted or retweeted this hashtag
-                                ht_val = u"#" + ht_pr[1].lower()
+                                ht_val = ht_pr[2]
                                 if (not G.has_node(user1)):
                                     G.add_node(user1)
                                     G.node[user1]['type'] = 'user'
@@ -228,7 +247,9 @@ for fn in listfile:
         break
 listfile.close()
 
-# Save to outfile
+# Save to outfile -- nodes are keyed by name in the saved graph and files,
+# the ids are only used while building it
+G = nx.relabel_nodes(G, dict([(n, names[n]) for n in G.nodes_iter()]))
 print "Saving graph to serialized outfile: {}".format(outfile_pckl)
 nx.write_gpickle(G, outfile_pckl)
 print "Done"
@@ -16,7 +16,9 @@ import cPickle as pickle
 import os
 # import pickle
 import re
+import struct
 import sys
+import tweet_store as ts
 
 def remove_punctuation(instr):
     out = re.sub(u'[-,?!,":;.()', u"", instr)
@@ -26,11 +28,32 @@ def punctuation_to_space (instr):
     out = re.sub(u'[-,?!,":;.()]', " ", instr)
     return out
 
+# First object of a streamed tweet file -- the rest are single transactions
+# A complete v2 stream ends with an index, (STREAM_INDEX, offsets of the
+# records a later record with the same key replaced), then STREAM_FOOTER and
+# the index offset as 8 raw bytes, so readers can keep the last copy of each
+# key in one pass.  v1 streams (and streams cut short) have no index.
+STREAM_MARKER = 'tweet_stream_v2'
+STREAM_MARKERS = ('tweet_stream_v1', STREAM_MARKER)
+STREAM_INDEX = 'tweet_stream_index'
+STREAM_FOOTER = 'tweet_stream_index_at'
+
+# Serialized formats: 'pickle' (one dict or a stream of transactions) or
+# 'columnar' (memory-mapped, see tweet_store.py)
+FORMATS = ['pickle', 'columnar']
+
 def load_tweets (input_file):
+    # Format is detected from the file contents
     transactions = {}
     try:
-        infile = open(input_file, 'r')
+        if (ts.is_columnar(input_file)):
+            return ts.load_columnar(input_file)
+        infile = open(input_file, 'rb')
         transactions = pickle.load(infile)
+        if (transactions in STREAM_MARKERS):
+            transactions = {}
+            for xact in read_stream(infile):
+                transactions[xact['id']] = xact
         infile.close()
     except IOError as e:
         print "I/O Error -- {} : {}".format(e.errno, e.strerror)
@@ -40,7 +63,186 @@ def load_tweets (input_file):
         transactions = {}
     return transactions
 
-def save_tweets (transactions, output_file):
+def save_tweets (transactions, output_file, format='pickle'):
+    if (format == 'columnar'):
+        ts.save_columnar(transactions, output_file)
+        return
     outfile = open(output_file, 'w')
     pickle.dump(transactions, outfile)
     outfile.close()
+
+def iter_tweets (input_file, fields=None):
+    # Yield (key, transaction) one at a time instead of loading the whole file.
+    # For columnar files each transaction is a lazy tweet_store.RecordView that
+    # only decodes the fields that are read (restricted to fields if given);
+    # pickled files give plain dicts.  A key repeated in the file is yielded once,
+    # with its last copy as in load_tweets.
+    # Errors are handled as in load_tweets: a stream cut short ends at the
+    # last whole record, any other error is printed and nothing more is yielded
+    try:
+        columnar = ts.is_columnar(input_file)
+        if (columnar):
+            store = ts.ColumnStore(input_file)
+            keep = store.last_indices()
+        else:
+            infile = open(input_file, 'rb')
+            transactions = pickle.load(infile)
+            if (transactions in STREAM_MARKERS):
+                start = infile.tell()
+                replaced = read_stream_index(infile)
+                if (replaced == None):
+                    # No index: a first pass finds the records to skip
+                    infile.seek(start)
+                    replaced = stream_offsets(infile)[1]
+                replaced = set(replaced)
+                infile.seek(start)
+                transactions = None
+    except IOError as e:
+        print "I/O Error -- {} : {}".format(e.errno, e.strerror)
+        return
+    except:
+        print "Unexpected error: {}".format(sys.exc_info()[0])
+        return
+    if (columnar):
+        for i in keep:
+            yield (store.key(i), store.view(i, fields))
+    elif (transactions == None):
+        while True:
+            offset = infile.tell()
+            try:
+                xact = pickle.load(infile)
+            except EOFError:
+                break
+            except:
+                print "Unexpected error: {}".format(sys.exc_info()[0])
+                break
+            if (isinstance(xact, tuple)):
+                break
+            if (offset not in replaced):
+                yield (xact['id'], xact)
+        infile.close()
+    else:
+        infile.close()
+        for (key, xact) in transactions.iteritems():
+            yield (key, xact)
+
+class _StreamKeys (dict):
+    # Stand-in for Tweet while stream_offsets reads a stream for its keys: the
+    # pickled field dict is taken as is, in C, instead of field by field
+    __setstate__ = dict.update
+
+def _find_stream_global (module, name):
+    if (module == 'tweet_record') and (name == 'Tweet'):
+        return _StreamKeys
+    __import__(module)
+    return getattr(sys.modules[module], name)
+
+def stream_offsets (infile):
+    # ({key: offset of its last record}, [offsets of records a later one
+    # replaced]) of an open streamed file positioned after the marker, read
+    # up to the index or the end of the last whole record like read_stream
+    unpickler = pickle.Unpickler(infile)
+    unpickler.find_global = _find_stream_global
+    last = {}
+    replaced = []
+    while True:
+        offset = infile.tell()
+        try:
+            xact = unpickler.load()
+        except EOFError:
+            break
+        if (isinstance(xact, tuple)):
+            break
+        key = xact['id']
+        if (key in last):
+            replaced.append(last[key])
+        last[key] = offset
+    return (last, replaced)
+
+def read_stream_index (infile):
+    # Offsets of the replaced records from the index at the end of an open
+    # streamed file, None if it has none
+    footer_bytes = len(STREAM_FOOTER) + 8
+    infile.seek(0, os.SEEK_END)
+    if (infile.tell() < footer_bytes):
+        return None
+    infile.seek(-footer_bytes, os.SEEK_END)
+    footer = infile.read(footer_bytes)
+    if (not footer.startswith(STREAM_FOOTER)):
+        return None
+    (index_at,) = struct.unpack('<q', footer[len(STREAM_FOOTER):])
+    infile.seek(index_at)
+    index = pickle.load(infile)
+    if (not isinstance(index, tuple)) or (index[0] != STREAM_INDEX):
+        return None
+    return index[1]
+
+def read_stream (infile):
+    # Yield transactions from an open streamed file positioned after the
+    # marker, up to the index at the end
+    while True:
+        try:
+            xact = pickle.load(infile)
+        except EOFError:
+            break
+        if (isinstance(xact, tuple)):
+            break
+        yield xact
+
+def read_stream_until (input_file, end):
+    # Transactions of a streamed file that were written before byte offset end
+    infile = open(input_file, 'rb')
+    pickle.load(infile)
+    while (infile.tell() < end):
+        yield pickle.load(infile)
+    infile.close()
+
+def save_tweets_stream (xacts, output_file, format='pickle', resume_at=None, checkpoint=None, every=10000):
+    # Pickle transactions one at a time as they arrive from an iterable, so
+    # the full set never needs to be in memory.  load_tweets reads either form.
+    # The columnar writer keeps only its compact column buffers until the end.
+    # Pickle streams only: resume_at appends to a partial stream cut back to
+    # that many bytes, and checkpoint(out_bytes, count) is called every
+    # `every` records once the output is flushed to disk.  The writer keeps
+    # the last offset of each key for the index written at the end.
+    if (format == 'columnar'):
+        writer = ts.ColumnWriter(output_file)
+        for xact in xacts:
+            writer.append(xact)
+        writer.close()
+        return writer.num
+    if (resume_at != None):
+        outfile = open(output_file, 'r+b')
+        outfile.truncate(resume_at)
+        pickle.load(outfile)
+        (last, replaced) = stream_offsets(outfile)
+        outfile.seek(resume_at)
+    else:
+        outfile = open(output_file, 'wb')
+        pickle.dump(STREAM_MARKER, outfile, pickle.HIGHEST_PROTOCOL)
+        last = {}
+        replaced = []
+    count = 0
+    for xact in xacts:
+        offset = outfile.tell()
+        pickle.dump(xact, outfile, pickle.HIGHEST_PROTOCOL)
+        key = xact['id']
+        if (key in last):
+            replaced.append(last[key])
+        last[key] = offset
+        count += 1
+        if (checkpoint != None) and ((count % every)==0):
+            outfile.flush()
+            os.fsync(outfile.fileno())
+            checkpoint(outfile.tell(), count)
+    index_at = outfile.tell()
+    pickle.dump((STREAM_INDEX, replaced), outfile, pickle.HIGHEST_PROTOCOL)
+    outfile.write(STREAM_FOOTER + struct.pack('<q', index_at))
+    outfile.close()
+    return count
+
+def convert_tweets (input_file, output_file, format='columnar'):
+    # Rewrite a serialized tweet file (any format) in the given format
+    transactions = load_tweets(input_file)
+    save_tweets(transactions, output_file, format)
+    return len(transactions)